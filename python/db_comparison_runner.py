@@ -5,12 +5,13 @@ import argparse
 import atexit
 import csv
 import json
+import multiprocessing
+import multiprocessing.connection
 import os
 import random
 import re
 import socket
 import statistics
-import struct
 import subprocess
 import sys
 import threading
@@ -18,41 +19,8 @@ import time
 from collections import defaultdict
 from pathlib import Path
 
-import pandas as pd
-from helpers import schema_keys
-from queries import static_job_queries, static_ssb_queries, static_tpcds_queries, static_tpch_queries
-
-# For a fair comparison, we use the same queries as the Umbra demo does.
-tpch_queries = static_tpch_queries.queries
-ssb_queries = static_ssb_queries.queries
-
-
-def query_blacklist(filename):
-    blacklist = set()
-    with open(filename) as f:
-        for line in f:
-            if not line.startswith("#"):
-                blacklist.add(line.strip())
-    return blacklist
-
-
-def load_queries(dir, blacklist={}):
-    queries = {}
-    for filename in Path(dir).glob("*.sql"):
-        if not filename.is_file() or filename.name in blacklist:
-            continue
-
-        with open(str(filename), "r") as sql_file:
-            sql_query = sql_file.read()
-            queries[filename.stem] = sql_query.strip()
-    return queries
-
-
-job_queries = load_queries("hyrise/third_party/join-order-benchmark", {"fkindexes.sql", "schema.sql"})
-tpcds_path = "hyrise/resources/benchmark/tpcds"
-tpcds_blacklist = query_blacklist(os.path.join(tpcds_path, "query_blacklist.cfg"))
-tpcds_queries = load_queries(os.path.join(tpcds_path, "tpcds-result-reproduction/query_qualification"), tpcds_blacklist)
-
+from helpers import latency_histogram, query_tables, schema_keys, server_log, stream_load
+from queries import query_registry
 
 # gather size information
 tables = {
@@ -111,122 +79,194 @@ tables = {
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
-    "dbms", type=str, choices=["monetdb", "hyrise", "greenplum", "umbra", "hana", "hana-int", "hyrise-int"]
+    "dbms", type=str, choices=["monetdb", "hyrise", "greenplum", "umbra", "hana", "hana-int", "hyrise-int", "duckdb"]
 )
 parser.add_argument("--time", "-t", type=int, default=7200)
-parser.add_argument("--port", "-p", type=int, default=5432)
+parser.add_argument("--port", "-p", type=int, default=None, help="Defaults to 50000 for MonetDB and 5432 otherwise")
+parser.add_argument(
+    "--dbpath", type=str, default="db_comparison_data/monetdb/data", help="Database directory of MonetDB"
+)
 parser.add_argument("--clients", type=int, default=1)
+parser.add_argument(
+    "--clients_sweep", type=str, default=None, help="Client counts to run one after another, e.g., 1,2,4"
+)
+parser.add_argument("--client_mode", type=str, default="thread", choices=["thread", "process"])
+parser.add_argument("--client_cpus", type=str, default=None, help="CPUs to pin client processes to, e.g., 56-63,120")
+parser.add_argument("--arrival_rate", type=float, default=None, help="Open-loop load with the given QPS")
+parser.add_argument("--arrival_process", type=str, default="poisson", choices=["poisson", "constant"])
 parser.add_argument("--cores", type=int, default=1)
 parser.add_argument("--memory_node", "-m", type=int, default=2)
 parser.add_argument("--benchmark", "-b", type=str, default="all", choices=["TPCH", "TPCDS", "JOB", "SSB", "all"])
 parser.add_argument("--hyrise_server_path", type=str, default="hyrise/cmake-build-release")
 parser.add_argument("--skip_warmup", action="store_true")
 parser.add_argument("--skip_data_loading", action="store_true")
+parser.add_argument("--load_all_tables", action="store_true", help="Load all tables, not only the required ones")
+parser.add_argument(
+    "--load_parallelism", type=int, default=1, help="Number of connections to load tables and add constraints with"
+)
+parser.add_argument(
+    "--load_mode",
+    type=str,
+    default="server",
+    choices=["server", "client"],
+    help="Let the DBMS read the files or stream (compressed) files from the client",
+)
 parser.add_argument("--rewrites", action="store_true")
 parser.add_argument("--O1", action="store_true")
 parser.add_argument("--O3", action="store_true")
+parser.add_argument(
+    "--paired", action="store_true", help="Run the original and the rewritten queries alternately in one session"
+)
 parser.add_argument("--rows", action="store_true")
 parser.add_argument("--no_numactl", action="store_true")
+parser.add_argument("--startup_timeout", type=int, default=600, help="Seconds to wait until the DBMS accepts queries")
+parser.add_argument("--shutdown_timeout", type=int, default=60, help="Seconds to wait for the DBMS to exit")
 parser.add_argument("--schema_keys", action="store_true")
+parser.add_argument("--cancel_at_deadline", action="store_true", help="Cancel running statements when time is up")
+parser.add_argument("--raw_samples", type=str, default="all", choices=["all", "reservoir", "none"])
+parser.add_argument("--reservoir_size", type=int, default=10000)
+parser.add_argument("--adaptive", action="store_true", help="Stop measuring a query once its CI has converged")
+parser.add_argument("--target_ci", type=float, default=0.05, help="Relative width of the 95%% CI to stop at")
+parser.add_argument("--adaptive_statistic", type=str, default="median", choices=["median", "mean"])
+parser.add_argument("--min_time", type=int, default=10)
+parser.add_argument("--max_time", type=int, default=None, help="Defaults to --time")
+parser.add_argument("--time_budget", type=int, default=None, help="Defaults to --time times the number of queries")
 args = parser.parse_args()
 assert not (args.rewrites and (args.O1 or args.O3)), "--rewrites is shorthand for --O1 --O3"
 # assert not (
 #     any([args.rewrites, args.O1, args.O3]) and "-int" in args.dbms
 # ), "Internal optimization works on original queries"
 
+if args.port is None:
+    args.port = 50000 if args.dbms == "monetdb" else 5432
+
 if args.dbms in ["hyrise", "hyrise-int"]:
     hyrise_server_path = Path(args.hyrise_server_path).expanduser().resolve()
     assert (hyrise_server_path / "hyriseServer").exists(), "Please pass valid --hyrise_server_path"
 
+client_counts = [int(client_count) for client_count in args.clients_sweep.split(",")] if args.clients_sweep else []
+if client_counts:
+    # We start the DBMS for the highest number of clients.
+    args.clients = max(client_counts)
+
 assert (
     args.clients == 1 or args.time >= 300
 ), "When multiple clients are set, a shuffled run is initiated, which should last at least 300s."
 
-if args.dbms in ["hyrise", "hyrise-int"]:
-    args.skip_data_loading = False
+assert args.client_cpus is None or args.client_mode == "process", "--client_cpus requires --client_mode process"
 
+if args.load_mode == "client":
+    # Hyrise and HANA can only load files from the server's file system.
+    assert args.dbms in ["umbra", "greenplum", "monetdb"], "Client-side loading needs COPY FROM STDIN or ON CLIENT."
 
-def update_hana_optimized_queries(original_queries, items):
-    updated_queries = original_queries.copy()
-    hints = [
-        "HEX_TABLE_SCAN_SEMI_JOIN",
-    ]
-    for item in items:
-        query = original_queries[item].strip()
-        if query.endswith(";"):
-            query = query[:-1]
-        query += f""" WITH HINT({", ".join(hints)});"""
-        updated_queries[item] = query
-    return updated_queries
+if args.arrival_rate:
+    assert args.dbms in ["hyrise", "hyrise-int", "umbra", "greenplum"], "Open-loop load needs the PostgreSQL protocol."
 
+if args.adaptive:
+    assert args.clients == 1, "Adaptive stopping is only supported for single-client runs"
+    assert not client_counts, "Adaptive stopping is not supported for client sweeps"
+    assert args.arrival_rate is None, "Adaptive stopping is not supported for open-loop runs"
+    args.max_time = args.max_time or args.time
+    assert args.min_time <= args.max_time, "--min_time must not exceed --max_time"
 
-if args.dbms in ["hana", "hana-int"]:
-    tpch_queries.update(static_tpch_queries.hana_queries)
-    job_queries.update(static_job_queries.hana_queries)
-    ssb_queries.update(static_ssb_queries.umbra_queries)
+if args.paired:
+    assert args.rewrites or args.O1 or args.O3, "Paired runs compare the original queries to --O1, --O3, or --rewrites"
+    assert args.clients == 1 and not client_counts, "Paired runs are only supported for single-client runs"
+    assert args.arrival_rate is None, "Paired runs are not supported for open-loop runs"
+    assert not args.adaptive, "Paired runs are not supported with adaptive stopping"
 
-elif args.dbms == "umbra":
-    ssb_queries.update(static_ssb_queries.umbra_queries)
+if args.dbms in ["hyrise", "hyrise-int", "duckdb"]:
+    args.skip_data_loading = False
 
-if args.rewrites or args.O1:
-    tpch_queries.update(static_tpch_queries.queries_o1)
-    tpcds_queries.update(static_tpcds_queries.queries_o1)
+if args.dbms == "duckdb":
+    # DuckDB runs inside the runner, so clients have to be threads that share the database.
+    assert args.client_mode == "thread", "DuckDB runs in-process and only supports --client_mode thread"
 
-    if args.dbms in ["hana", "hana-int"]:
-        tpch_queries.update(static_tpch_queries.hana_queries_o1)
 
-if args.rewrites or args.O3:
-    tpch_queries.update(static_tpch_queries.queries_o3)
-    ssb_queries.update(static_ssb_queries.queries_o3)
-    job_queries.update(static_job_queries.queries_o3)
-    tpcds_queries.update(static_tpcds_queries.queries_o3)
+def parse_cpu_list(cpu_string):
+    cpus = list()
+    for cpu_range in cpu_string.split(","):
+        if "-" in cpu_range:
+            first, last = cpu_range.split("-")
+            cpus += list(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(cpu_range))
+    return cpus
 
-    if args.dbms in ["hana", "hana-int"]:
-        tpch_queries.update(static_tpch_queries.hana_queries_o3)
-        job_queries.update(static_job_queries.hana_queries_o3)
-        ssb_queries.update(static_ssb_queries.umbra_queries_o3)
-    elif args.dbms == "umbra":
-        ssb_queries.update(static_ssb_queries.umbra_queries_o3)
 
-if args.dbms == "hana-int":
-    tpch_queries = update_hana_optimized_queries(tpch_queries, list(static_tpch_queries.queries_o3.keys()))
-    tpcds_queries = update_hana_optimized_queries(tpcds_queries, list(static_tpcds_queries.queries_o3.keys()))
-    ssb_queries = update_hana_optimized_queries(ssb_queries, list(static_ssb_queries.queries_o3.keys()))
-    job_queries = update_hana_optimized_queries(job_queries, list(static_job_queries.queries_o3.keys()))
+client_cpus = parse_cpu_list(args.client_cpus) if args.client_cpus else []
 
-tpch_queries = [tpch_queries[q] for q in sorted(tpch_queries.keys())]
-tpcds_queries = [tpcds_queries[q] for q in sorted(tpcds_queries.keys())]
-ssb_queries = [ssb_queries[q] for q in sorted(ssb_queries.keys())]
-job_queries = [job_queries[q] for q in sorted(job_queries.keys())]
 
-assert len(tpch_queries) == 22
-assert len(tpcds_queries) == 48
-assert len(ssb_queries) == 13
-assert len(job_queries) == 113
+# Only the selected benchmarks' queries are loaded (or read from the query cache).
+selected_benchmarks = query_registry.benchmarks if args.benchmark == "all" else [args.benchmark]
+selected_query_names, selected_benchmark_queries = list(), list()
+# In paired runs, the original queries are the baseline for the rewritten ones.
+baseline_benchmark_queries = list()
+for benchmark in selected_benchmarks:
+    query_names, queries = query_registry.benchmark_queries(
+        benchmark, args.dbms, args.rewrites or args.O1, args.rewrites or args.O3
+    )
+    selected_query_names += query_names
+    selected_benchmark_queries += queries
+    if args.paired:
+        baseline_benchmark_queries += query_registry.benchmark_queries(benchmark, args.dbms)[1]
+
+# Queries of both variants that differ, i.e., the ones a paired run measures.
+paired_items = [
+    item
+    for item, (baseline_query, query) in enumerate(zip(baseline_benchmark_queries, selected_benchmark_queries))
+    if baseline_query != query
+]
+
+
+def get_connection_parameters():
+    # Connection parameters of the systems that speak the PostgreSQL wire protocol.
+    if args.dbms in ["hyrise", "hyrise-int"]:
+        return {"host": "localhost", "port": args.port}
+    elif args.dbms == "umbra":
+        # return {"host": "/tmp", "user": "postgres"}
+        return {"host": "127.0.0.1", "port": args.port, "user": "postgres", "password": "postgres"}
+    elif args.dbms == "greenplum":
+        host = socket.gethostname()
+        return {"host": host, "port": args.port, "dbname": "dbbench", "user": "bench", "password": "password"}
+    raise AttributeError(f"{args.dbms} does not use the PostgreSQL wire protocol")
+
+
+def retry_with_backoff(action, timeout, description):
+    # Calls action until it succeeds. Between attempts, we wait 0.1 s, 0.2 s, 0.4 s, ..., but at most 5 s. We give up
+    # once the timeout would pass or the DBMS process exited.
+    deadline = time.perf_counter() + timeout
+    delay = 0.1
+    while True:
+        try:
+            return action()
+        except Exception as e:
+            if dbms_process and dbms_process.poll() is not None:
+                raise RuntimeError(f"{description}: {args.dbms} exited with code {dbms_process.returncode}") from e
+            if time.perf_counter() + delay > deadline:
+                raise TimeoutError(f"{description}: no success within {timeout} s, last error: {e}") from e
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
 
 
 def get_cursor():
     if args.dbms == "monetdb":
-        connection = None
-        attempts = 0
-        while connection is None:
-            try:
-                attempts += 1
-                connection = pymonetdb.connect("", connect_timeout=600, autocommit=True)
-            except Exception as e:
-                print(e)
-                time.sleep(1)
-                if attempts > 5:
-                    raise e
+        connection = retry_with_backoff(
+            lambda: pymonetdb.connect("", port=args.port, connect_timeout=600, autocommit=True),
+            args.startup_timeout,
+            "Connecting to MonetDB",
+        )
         connection.settimeout(600)
-    elif args.dbms in ["hyrise", "hyrise-int"]:
-        connection = psycopg2.connect("host=localhost port={}".format(args.port))
-    elif args.dbms == "umbra":
-        # connection = psycopg2.connect(host="/tmp", user="postgres")
-        connection = psycopg2.connect(host="127.0.0.1", user="postgres", password="postgres")
-    elif args.dbms == "greenplum":
-        host = socket.gethostname()
-        connection = psycopg2.connect(host=host, port=args.port, dbname="dbbench", user="bench", password="password")
+        if args.load_mode == "client":
+            connection.set_uploader(
+                stream_load.monetdb_uploader(os.path.join(os.getcwd(), "resources/experiment_data"))
+            )
+    elif args.dbms in ["hyrise", "hyrise-int", "umbra", "greenplum"]:
+        connection = psycopg2.connect(**get_connection_parameters())
+    elif args.dbms == "duckdb":
+        # Each client gets its own connection to the shared in-process database. It executes queries itself.
+        connection = duckdb_database.cursor()
+        return (connection, connection)
     elif args.dbms in ["hana", "hana-int"]:
         with open("resources/database_connection.json", "r") as file:
             connection_data = json.load(file)
@@ -244,101 +284,262 @@ def get_cursor():
     return (connection, cursor)
 
 
+def quoted_table(table_name):
+    return f'"{table_name}"' if table_name == "date" else table_name
+
+
+def existing_constraints(cursor):
+    # Names of the constraints we added before (comp_pk_<id> and comp_fk_<id>) according to the system catalog.
+    if args.dbms == "greenplum":
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conname LIKE 'comp%';")
+    elif args.dbms == "monetdb":
+        cursor.execute("SELECT name FROM sys.keys WHERE name LIKE 'comp%';")
+    elif args.dbms in ["hana", "hana-int"]:
+        # HANA stores unquoted identifiers in upper case.
+        cursor.execute(
+            "SELECT CONSTRAINT_NAME FROM SYS.CONSTRAINTS WHERE SCHEMA_NAME = CURRENT_SCHEMA "
+            "UNION SELECT CONSTRAINT_NAME FROM SYS.REFERENTIAL_CONSTRAINTS WHERE SCHEMA_NAME = CURRENT_SCHEMA;"
+        )
+    constraint_name_regex = re.compile(r"comp_(pk|fk)_\d+")
+    constraint_names = {row[0].lower() for row in cursor.fetchall()}
+    return {constraint_name for constraint_name in constraint_names if constraint_name_regex.fullmatch(constraint_name)}
+
+
+def execute_constraint_statements(statements, action):
+    """Execute the statements, given as (constraint name, touched tables, SQL) tuples, on multiple connections.
+
+    Statements that touch the same table never run at the same time. They would wait for each other's table locks
+    anyway and could deadlock otherwise. Returns the duration of each statement. Failed statements are reported, and
+    their constraints are missing afterwards.
+    """
+    pending_statements = list(statements)
+    durations = {}
+    busy_tables = set()
+    condition = threading.Condition()
+    # MonetDB aborts concurrent schema changes due to its optimistic concurrency control.
+    parallelism = 1 if args.dbms == "monetdb" else args.load_parallelism
+
+    def next_statement():
+        for statement in pending_statements:
+            if not statement[1] & busy_tables:
+                pending_statements.remove(statement)
+                return statement
+        return None
+
+    def worker():
+        connection, cursor = get_cursor()
+        while True:
+            with condition:
+                statement = next_statement()
+                while statement is None and pending_statements:
+                    condition.wait()
+                    statement = next_statement()
+                if statement is None:
+                    break
+                constraint_name, statement_tables, sql = statement
+                busy_tables.update(statement_tables)
+
+            start = time.perf_counter()
+            try:
+                cursor.execute(sql)
+                if args.dbms in ["umbra", "greenplum"]:
+                    connection.commit()
+                error = None
+            except Exception as e:
+                if args.dbms in ["umbra", "greenplum"]:
+                    connection.rollback()
+                error = e
+            duration = time.perf_counter() - start
+
+            with condition:
+                busy_tables.difference_update(statement_tables)
+                tables = ", ".join(sorted(statement_tables))
+                if error is None:
+                    durations[constraint_name] = duration
+                    progress = f"({len(durations)}/{len(statements)})"
+                    print(f" - {progress} {action} {constraint_name} on {tables} ({round(duration, 1)} s)")
+                else:
+                    print(f" - Error: {action} {constraint_name} on {tables}: {str(error).strip()}")
+                condition.notify_all()
+
+        cursor.close()
+        connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(min(parallelism, len(statements)))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return durations
+
+
+def report_constraint_durations(durations, kind, elapsed):
+    total = sum(durations.values())
+    print(
+        f"- Added {len(durations)} {kind} constraints ({round(elapsed, 1)} s, "
+        f"{round(total, 1)} s summed up over all constraints)"
+    )
+    slowest = sorted(durations.items(), key=lambda item: item[1], reverse=True)[:5]
+    if slowest:
+        print("  Slowest: " + ", ".join(f"{name} ({round(duration, 1)} s)" for name, duration in slowest))
+
+
 def add_constraints(skip):
     if skip:
         return
-    connection, cursor = get_cursor()
-
-    start = time.perf_counter()
 
+    # Constraint IDs are the positions in schema_keys, so they stay the same when we skip tables that were not loaded.
     add_pk_command = """ALTER TABLE {} ADD CONSTRAINT comp_pk_{} PRIMARY KEY ({});"""
-    constraint_id = 1
-    for table_name, column_names in schema_keys.primary_keys:
-        print(f"\r- Add PRIMARY KEY constraints ({constraint_id}/{len(schema_keys.primary_keys)})", end="")
-        table = f'"{table_name}"' if table_name == "date" else table_name
-        cursor.execute(add_pk_command.format(table, constraint_id, ", ".join(column_names)))
-        constraint_id += 1
-    end = time.perf_counter()
-    print(f"\r- Added {len(schema_keys.primary_keys)} PRIMARY KEY constraints ({round(end - start, 1)} s)")
-    start = end
+    statements = []
+    for constraint_id, (table_name, column_names) in enumerate(schema_keys.primary_keys, start=1):
+        if required_tables is not None and table_name not in required_tables:
+            continue
+        sql = add_pk_command.format(quoted_table(table_name), constraint_id, ", ".join(column_names))
+        statements.append((f"comp_pk_{constraint_id}", {table_name}, sql))
 
-    add_fk_command = """ALTER TABLE {} ADD CONSTRAINT comp_fk_{} FOREIGN KEY ({}) REFERENCES {} ({});"""
-    constraint_id = 1
-    for table_name, column_names, referenced_table, referenced_column_names in schema_keys.foreign_keys:
-        print(f"\r- Add FOREIGN KEY constraints ({constraint_id}/{len(schema_keys.foreign_keys)})", end="")
-        table = f'"{table_name}"' if table_name == "date" else table_name
-        referenced_table_name = f'"{referenced_table}"' if referenced_table == "date" else referenced_table
-        try:
-            cursor.execute(
-                add_fk_command.format(
-                    table,
-                    constraint_id,
-                    ", ".join(column_names),
-                    referenced_table_name,
-                    ", ".join(referenced_column_names),
-                )
-            )
-        except Exception as e:
-            print(f"""\n - Error adding FK {table} ({", ".join(column_names)})""", end=" ")
-            print(f"""REFERENCES {referenced_table_name} ({", ".join(referenced_column_names)}):""")
-            print(f"    {str(e)}")
-            pass
+    start = time.perf_counter()
+    durations = execute_constraint_statements(statements, "Added")
+    end = time.perf_counter()
+    assert len(durations) == len(statements), "Could not add all PRIMARY KEY constraints"
+    report_constraint_durations(durations, "PRIMARY KEY", end - start)
+
+    # Greenplum can add foreign keys without checking them (NOT VALID), which only needs a short lock. Validating them
+    # afterwards does not block other validations on the referenced table, so more of them can run in parallel.
+    defer_validation = args.dbms == "greenplum"
+    add_fk_command = """ALTER TABLE {} ADD CONSTRAINT comp_fk_{} FOREIGN KEY ({}) REFERENCES {} ({}){};"""
+    validate_fk_command = """ALTER TABLE {} VALIDATE CONSTRAINT comp_fk_{};"""
+    statements = []
+    validate_statements = []
+    for constraint_id, (table_name, column_names, referenced_table, referenced_column_names) in enumerate(
+        schema_keys.foreign_keys, start=1
+    ):
+        if required_tables is not None and table_name not in required_tables:
+            continue
+        sql = add_fk_command.format(
+            quoted_table(table_name),
+            constraint_id,
+            ", ".join(column_names),
+            quoted_table(referenced_table),
+            ", ".join(referenced_column_names),
+            " NOT VALID" if defer_validation else "",
+        )
+        statements.append((f"comp_fk_{constraint_id}", {table_name, referenced_table}, sql))
+        validate_sql = validate_fk_command.format(quoted_table(table_name), constraint_id)
+        validate_statements.append((f"comp_fk_{constraint_id}", {table_name}, validate_sql))
 
-        constraint_id += 1
+    start = time.perf_counter()
+    durations = execute_constraint_statements(statements, "Added")
+    if defer_validation:
+        validate_statements = [statement for statement in validate_statements if statement[0] in durations]
+        durations = execute_constraint_statements(validate_statements, "Validated")
     end = time.perf_counter()
-    print(f"\r- Added {len(schema_keys.foreign_keys)} FOREIGN KEY constraints ({round(end - start, 1)} s)")
+    report_constraint_durations(durations, "FOREIGN KEY", end - start)
+
 
+def drop_constraints(skip):
+    if skip:
+        return
+    connection, cursor = get_cursor()
+    constraint_names = existing_constraints(cursor)
     cursor.close()
     if args.dbms in ["umbra", "greenplum"]:
         connection.commit()
     connection.close()
 
+    # Foreign keys have to be dropped before the primary keys they reference.
+    drop_command = """ALTER TABLE {} DROP CONSTRAINT {};"""
+    statements = []
+    for constraint_id, (table_name, _, referenced_table, _) in enumerate(schema_keys.foreign_keys, start=1):
+        constraint_name = f"comp_fk_{constraint_id}"
+        if constraint_name in constraint_names:
+            sql = drop_command.format(quoted_table(table_name), constraint_name)
+            statements.append((constraint_name, {table_name, referenced_table}, sql))
+    print(f"- Drop {len(statements)} FOREIGN KEY constraints ...")
+    execute_constraint_statements(statements, "Dropped")
+
+    statements = []
+    for constraint_id, (table_name, _) in enumerate(schema_keys.primary_keys, start=1):
+        constraint_name = f"comp_pk_{constraint_id}"
+        if constraint_name in constraint_names:
+            statements.append(
+                (constraint_name, {table_name}, drop_command.format(quoted_table(table_name), constraint_name))
+            )
+    print(f"- Drop {len(statements)} PRIMARY KEY constraints ...")
+    execute_constraint_statements(statements, "Dropped")
+
+
+def result_file_prefix():
+    row_suffix = "-rows" if args.rows else ""
+    rewrite_suffix = ""
+    if args.O1:
+        rewrite_suffix += "__O1"
+    if args.O3:
+        rewrite_suffix += "__O3"
+    if args.rewrites:
+        rewrite_suffix += "__rewrites"
+    if args.schema_keys:
+        rewrite_suffix += "__keys"
+    if args.arrival_rate:
+        rewrite_suffix += f"__qps{args.arrival_rate:g}_{args.arrival_process}"
+    return "db_comparison_results/database_comparison__{}__{}{}{}".format(
+        args.benchmark, args.dbms, row_suffix, rewrite_suffix
+    )
 
-def drop_constraints(skip):
-    if skip:
-        return
-    connection, cursor = get_cursor()
 
-    print("- Drop FOREIGN KEY constraints ...")
-    drop_fk_command = """ALTER TABLE {} DROP CONSTRAINT comp_fk_{};"""
-    constraint_id = 1
+def server_log_path():
+    # One log per run of the server, named after the run's result files.
+    os.makedirs("db_comparison_results/server_logs", exist_ok=True)
+    return "db_comparison_results/server_logs/{}__{}.log".format(
+        os.path.basename(result_file_prefix()), time.strftime("%Y%m%d-%H%M%S")
+    )
 
-    for table_name, _, _, _ in schema_keys.foreign_keys:
-        table = f'"{table_name}"' if table_name == "date" else table_name
-        try:
-            cursor.execute(drop_fk_command.format(table, constraint_id))
-        except Exception:
-            pass
-        constraint_id += 1
 
-    print("- Drop PRIMARY KEY constraints ...")
-    drop_pk_command = """ALTER TABLE {} DROP CONSTRAINT comp_pk_{};"""
-    constraint_id = 1
+dbms_process = None
+dbms_log = None
+
 
-    for table_name, _ in schema_keys.primary_keys:
-        table = f'"{table_name}"' if table_name == "date" else table_name
+def wait_until_ready():
+    # The DBMS is ready once it answers a trivial query.
+    probe = "SELECT 1 FROM DUMMY;" if args.dbms in ["hana", "hana-int"] else "SELECT 1;"
+
+    def execute_probe():
+        connection, cursor = get_cursor()
         try:
-            cursor.execute(drop_pk_command.format(table, constraint_id))
-        except Exception:
-            pass
-        constraint_id += 1
+            cursor.execute(probe)
+            cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
 
-    cursor.close()
-    if args.dbms in ["umbra", "greenplum"]:
-        connection.commit()
-    connection.close()
+    start = time.perf_counter()
+    retry_with_backoff(execute_probe, args.startup_timeout, f"Waiting for {args.dbms}")
+    print(f"- {args.dbms} is ready ({round(time.perf_counter() - start, 1)} s)")
 
 
-dbms_process = None
+def wait_until_stopped(process_pattern):
+    # Waits until no process matches the pattern (see pgrep -f).
+    def check_stopped():
+        if subprocess.run(["pgrep", "-f", process_pattern], stdout=subprocess.DEVNULL).returncode == 0:
+            raise RuntimeError(f"Processes matching '{process_pattern}' are still running")
+
+    retry_with_backoff(check_stopped, args.shutdown_timeout, "Stopping old servers")
 
 
 def cleanup():
     if dbms_process:
         print("Shutting {} down...".format(args.dbms))
         if args.dbms == "hana-int" or args.schema_keys:
-            drop_constraints(args.dbms in ["umbra", "hyrise", "hyrise-int"])
-        dbms_process.kill()
-        time.sleep(10)
+            drop_constraints(args.dbms in ["umbra", "hyrise", "hyrise-int", "duckdb"])
+        # Let the server shut down cleanly, but do not wait forever.
+        dbms_process.terminate()
+        try:
+            dbms_process.wait(timeout=args.shutdown_timeout)
+        except subprocess.TimeoutExpired:
+            print(f"{args.dbms} did not exit within {args.shutdown_timeout} s, killing it.")
+            dbms_process.kill()
+            dbms_process.wait()
+    if dbms_log:
+        dbms_log.close()
 
 
 atexit.register(cleanup)
@@ -351,15 +552,22 @@ if not args.no_numactl:
 if args.dbms == "monetdb":
     import pymonetdb
 
+    from helpers import monetdb_binary
+
     monetdb_home = os.path.join(os.getcwd(), "db_comparison_data", "monetdb")
+    monetdb_dbpath = os.path.abspath(args.dbpath)
 
-    subprocess.Popen(["pkill", "-9", "mserver5"])
-    time.sleep(5)
+    # Only kill servers of our database, other experiments might run MonetDB on another NUMA node.
+    monetdb_pattern = f"mserver5 --dbpath={monetdb_dbpath}"
+    subprocess.run(["pkill", "-9", "-f", monetdb_pattern])
+    wait_until_stopped(monetdb_pattern)
     cmd = numactl_command + [
         "{}/bin/mserver5".format(monetdb_home),
-        "--dbpath={}/data".format(monetdb_home),
+        "--dbpath={}".format(monetdb_dbpath),
         "--set",
         "gdk_nr_threads={}".format(args.cores),
+        "--set",
+        "mapi_port={}".format(args.port),
     ]
 
     if args.clients > 62:
@@ -367,14 +575,19 @@ if args.dbms == "monetdb":
     if args.clients < 33:
         # We have seen strange errors when using the inmemory option and 64 clients (bat file not existing)
         cmd.append("--dbextra=inmemory")
-    dbms_process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    while True:
-        line = dbms_process.stdout.readline()
-        if b"MonetDB/SQL module loaded" in line:
-            break
+    dbms_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # The server's output is drained for the whole run. Otherwise, MonetDB blocks once the pipe is full.
+    dbms_log = server_log.ServerLog(server_log_path())
+    dbms_log.drain(dbms_process.stdout, "stdout")
+    dbms_log.drain(dbms_process.stderr, "stderr")
+    assert (
+        dbms_log.wait_for("startup", args.startup_timeout) is not None
+    ), f"MonetDB did not start, see {dbms_log.file.name}"
 elif args.dbms in ["hyrise", "hyrise-int"]:
     import psycopg2
 
+    from helpers import hyrise_binary
+
     allow_schema_env = {"JOIN_TO_PREDICATE": "0"} if args.schema_keys and args.dbms != "hyrise-int" else {}
     dbms_process = subprocess.Popen(
         numactl_command
@@ -387,56 +600,140 @@ elif args.dbms in ["hyrise", "hyrise-int"]:
         stderr=subprocess.PIPE,
         env=allow_schema_env,
     )
-    time.sleep(5)
-    while True:
-        line = dbms_process.stdout.readline()
-        print(line.decode(), end="")
-        if b"Server started at" in line:
-            break
+    # The server's output is drained for the whole run, but only printed until the server started.
+    dbms_log = server_log.ServerLog(server_log_path(), echo=True)
+    dbms_log.drain(dbms_process.stdout, "stdout")
+    dbms_log.drain(dbms_process.stderr, "stderr")
+    assert (
+        dbms_log.wait_for("startup", args.startup_timeout) is not None
+    ), f"Hyrise did not start, see {dbms_log.file.name}"
+    dbms_log.echo = False
 elif args.dbms == "umbra":
     import psycopg2
 
     print("Make sure to start Umbra before by starting the Docker container")
-    time.sleep(1)
 elif args.dbms == "greenplum":
     import psycopg2
 
     print("Make sure to start Greenplum before by running ./scripts/greenplum_init.sh")
-    time.sleep(1)
+elif args.dbms == "duckdb":
+    import duckdb
+
+    # There is no server to pin with numactl, so we pin the runner itself before DuckDB starts its threads. To bind
+    # the memory to a NUMA node, run the runner with numactl -m (as run_experiments.py does).
+    if not args.no_numactl:
+        os.sched_setaffinity(0, sorted(os.sched_getaffinity(0))[: args.cores])
+    duckdb_database = duckdb.connect(":memory:", config={"threads": args.cores})
 elif args.dbms in ["hana", "hana-int"]:
     from hdbcli import dbapi
 
+    from helpers import encode
+
+wait_until_ready()
+
+if args.arrival_rate:
+    from helpers import open_loop
+
+
+def load_tables_in_parallel(table_order, import_table):
+    # Umbra and DuckDB check foreign keys while loading, so referenced tables have to be loaded (and committed) first.
+    # The other systems add the constraints after loading, so any order works.
+    dependencies = {table_name: set() for table_name in table_order}
+    if args.dbms in ["umbra", "duckdb"] and args.schema_keys:
+        for table_name, _, referenced_table, _ in schema_keys.foreign_keys:
+            if table_name != referenced_table and table_name in dependencies and referenced_table in dependencies:
+                dependencies[table_name].add(referenced_table)
+
+    # Start with the largest tables so they do not end up as stragglers.
+    def table_size(table_name):
+        table_file_path = stream_load.source_file_path(os.path.join("resources/experiment_data", f"{table_name}.csv"))
+        return os.path.getsize(table_file_path) if table_file_path else 0
+
+    pending_tables = sorted(table_order, key=table_size, reverse=True)
+    loaded_tables = set()
+    load_durations = {}
+    errors = []
+    tables_in_progress = []
+    condition = threading.Condition()
+
+    def next_table():
+        for table_name in pending_tables:
+            if dependencies[table_name] <= loaded_tables:
+                pending_tables.remove(table_name)
+                return table_name
+        return None
+
+    def worker():
+        connection, cursor = get_cursor()
+        while True:
+            with condition:
+                table_name = next_table()
+                while table_name is None and pending_tables and tables_in_progress and not errors:
+                    condition.wait()
+                    table_name = next_table()
+                if table_name is None:
+                    break
+                tables_in_progress.append(table_name)
+
+            try:
+                duration = import_table(cursor, table_name)
+                if args.dbms in ["umbra", "greenplum"]:
+                    connection.commit()
+            except Exception as e:
+                with condition:
+                    errors.append(e)
+                    tables_in_progress.remove(table_name)
+                    condition.notify_all()
+                break
+
+            with condition:
+                tables_in_progress.remove(table_name)
+                loaded_tables.add(table_name)
+                load_durations[table_name] = duration
+                print(f" - ({len(loaded_tables)}/{len(table_order)}) Imported {table_name} ({round(duration, 1)} s)")
+                condition.notify_all()
+
+        cursor.close()
+        connection.close()
 
-def parse_data_type(type_string):
-    if type_string == "int":
-        return "Int32"
-    elif type_string == "long":
-        return "Int64"
-    elif type_string == "float":
-        return "Float32"
-    elif type_string == "double":
-        return "Float64"
-    elif type_string == "string":
-        return "string"
-    raise AttributeError(f"Unknown data type: '{type_string}'")
-
-
-def parse_csv_meta(meta):
-    column_names = list()
-    column_data_types = dict()
-    nullable = dict()
-    for column_meta in meta["columns"]:
-        column_name = column_meta["name"]
-        column_names.append(column_name)
-        column_data_types[column_name] = parse_data_type(column_meta["type"])
-        nullable[column_name] = column_meta["nullable"]
-    return column_names, column_data_types, nullable
+    workers = [threading.Thread(target=worker) for _ in range(min(args.load_parallelism, len(table_order)))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    assert not pending_tables, f"Could not load {pending_tables} due to unresolvable foreign key dependencies"
+    return load_durations
+
+
+def schema_tables():
+    table_name_regex = re.compile(r'(?<=CREATE\sTABLE\s)"?\w+"?(?=\s*\()', flags=re.IGNORECASE)
+    table_order = []
+    create_table_statements = []
+
+    for benchmark in ["tpch", "tpcds", "ssb", "job"]:
+        with open(f"resources/schema_{benchmark}.sql") as f:
+            for line in f:
+                stripped_line = line.strip()
+                if not stripped_line:
+                    continue
+                table_name = table_name_regex.search(stripped_line).group().replace('"', "")
+                table_order.append(table_name)
+                create_table_statements.append(stripped_line)
+    return table_order, create_table_statements
 
 
 def import_data():
     data_path = os.path.join(os.getcwd(), "resources/experiment_data")
 
-    if args.dbms == "monetdb":
+    if args.dbms == "monetdb" and args.load_mode == "client":
+        # File names are relative to the data path, see helpers/stream_load.py.
+        load_command = """COPY INTO "{}" FROM '{}' ON CLIENT USING DELIMITERS ',', '\n', '"' NULL AS '';"""
+    elif args.dbms in ["umbra", "greenplum"] and args.load_mode == "client":
+        load_command = """COPY "{}" FROM STDIN WITH (FORMAT CSV, DELIMITER ',', NULL '', QUOTE '"');"""
+    elif args.dbms == "monetdb":
         load_command = """COPY INTO "{}" FROM '{}' USING DELIMITERS ',', '\n', '"' NULL AS '';"""
     elif args.dbms in ["hyrise", "hyrise-int"]:
         load_command = """COPY "{}" FROM '{}';"""
@@ -444,29 +741,19 @@ def import_data():
         load_command = """COPY "{}" FROM '{}' WITH (FORMAT CSV, DELIMITER ',', NULL '', QUOTE '"');"""
     elif args.dbms == "greenplum":
         load_command = """COPY "{}" FROM '{}' WITH (FORMAT CSV, DELIMITER ',', NULL '', QUOTE '"');"""
+    elif args.dbms == "duckdb":
+        # DuckDB's CSV reader parses a file with multiple threads. We pass the format so it does not sniff it.
+        load_command = """COPY "{}" FROM '{}' (FORMAT CSV, DELIMITER ',', NULL '', QUOTE '"', HEADER false);"""
     elif args.dbms in ["hana", "hana-int"]:
         load_command = (
             """IMPORT FROM CSV FILE '{}' INTO {} WITH FIELD DELIMITED BY ',' ESCAPE '"' FAIL ON INVALID DATA;"""
         )
 
     connection, cursor = get_cursor()
-    table_name_regex = re.compile(r'(?<=CREATE\sTABLE\s)"?\w+"?(?=\s*\()', flags=re.IGNORECASE)
-    table_order = []
-    create_table_statements = []
+    table_order, create_table_statements = schema_tables()
     print("- Loading data ...")
 
-    for benchmark in ["tpch", "tpcds", "ssb", "job"]:
-        # if args.benchmark != "all" and args.benchmark.lower() != benchmark:
-        #     continue
-        with open(f"resources/schema_{benchmark}.sql") as f:
-            for line in f:
-                stripped_line = line.strip()
-                if not stripped_line:
-                    continue
-                table_name = table_name_regex.search(stripped_line).group().replace('"', "")
-                table_order.append(table_name)
-                create_table_statements.append(stripped_line)
-
+    # Drop all tables, not only the required ones, so that no tables of earlier runs are left behind.
     for table_name in reversed(table_order):
         if not args.dbms.startswith("hana"):
             cursor.execute(f'DROP TABLE IF EXISTS "{table_name}";')
@@ -478,6 +765,15 @@ def import_data():
                 print("-  Could not drop table {} ({}) - continue".format(table, e))
                 pass
 
+    if required_tables is not None:
+        create_table_statements = [
+            create_statement
+            for table_name, create_statement in zip(table_order, create_table_statements)
+            if table_name in required_tables
+        ]
+        table_order = [table_name for table_name in table_order if table_name in required_tables]
+        print(f"- Loading {len(table_order)} tables required by the selected queries")
+
     primary_keys = {}
     for table_name, column_names in schema_keys.primary_keys:
         primary_keys[table_name] = column_names
@@ -504,8 +800,8 @@ def import_data():
 
                 create_statement = create_statement.replace("text", "nvarchar(1024)")
 
-            # Umbra does not allow to add constraints later, so we have to do it now.
-            if args.dbms == "umbra" and args.schema_keys:
+            # Umbra and DuckDB do not allow to add constraints later, so we have to do it now.
+            if args.dbms in ["umbra", "duckdb"] and args.schema_keys:
                 create_statement = create_statement[:-1].strip() if create_statement.endswith(";") else create_statement
                 create_statement = create_statement[:-1]
                 if table_name in primary_keys:
@@ -525,70 +821,61 @@ def import_data():
             "('import_export','enable_csv_import_path_filter') = 'false' with reconfigure;"
         )
 
-        # We could not manage to load these tuples from CSV.
-        cursor.execute(
-            "INSERT INTO title VALUES (   9795, 'Null', NULL, 7, NULL, NULL, 'N4', 9785,    1,    11, NULL, '22370d39fa0b1593019c23d5e4ccfca9');"  # noqa: E501
-        )
-        cursor.execute(
-            "INSERT INTO title VALUES (2162886, 'Null', NULL, 1, 2009, NULL, 'N4', NULL, NULL, NULL , NULL, '59cf04844319a809042d47e26ac4074b');"  # noqa: E501
-        )
-        cursor.execute(
-            "INSERT INTO char_name VALUES (590883, 'Null', NULL, NULL, 'N4' , NULL, 'bbb93ef26e3c101ff11cdd21cab08a94');"  # noqa: E501
-        )
+        # We could not manage to load these tuples from CSV. Only insert them if we created the table.
+        fixup_statements = [
+            (
+                "title",
+                "INSERT INTO title VALUES (   9795, 'Null', NULL, 7, NULL, NULL, 'N4', 9785,    1,    11, NULL, '22370d39fa0b1593019c23d5e4ccfca9');",  # noqa: E501
+            ),
+            (
+                "title",
+                "INSERT INTO title VALUES (2162886, 'Null', NULL, 1, 2009, NULL, 'N4', NULL, NULL, NULL , NULL, '59cf04844319a809042d47e26ac4074b');",  # noqa: E501
+            ),
+            (
+                "char_name",
+                "INSERT INTO char_name VALUES (590883, 'Null', NULL, NULL, 'N4' , NULL, 'bbb93ef26e3c101ff11cdd21cab08a94');",  # noqa: E501
+            ),
+        ]
+        for table_name, statement in fixup_statements:
+            if table_name in table_order:
+                cursor.execute(statement)
+
+    # Parallel loaders use their own connections, which have to see the new tables (and must not wait for our locks).
+    if args.dbms in ["umbra", "greenplum", "hana", "hana-int"]:
+        connection.commit()
 
-    for t_id, table_name in enumerate(table_order):
-        table_file_path = f"{data_path}/{table_name}.csv"
-        binary_file_path = f"{data_path}/{table_name}.bin"
-        has_binary = os.path.isfile(binary_file_path)
-        if has_binary and args.dbms in ["hyrise", "hyrise-int"]:
-            table_file_path = binary_file_path
-        print(f" - ({t_id + 1}/{len(table_order)}) Import {table_name} from {table_file_path} ...", end=" ", flush=True)
+    def table_source(table_name):
+        if args.dbms in ["hyrise", "hyrise-int"]:
+            return hyrise_binary.binary_file_path(data_path, table_name)
+        if args.load_mode == "client":
+            return stream_load.source_file_path(f"{data_path}/{table_name}.csv")
+        return f"{data_path}/{table_name}.csv"
+
+    def import_table(cursor, table_name):
         start = time.perf_counter()
+        table_file_path = table_source(table_name)
 
         if args.dbms == "monetdb" and table_name in tables["JOB"]:
-            # MonetDB does not like some IMDB CSV files, so we encode them in their binary format.
-            binary_data_types = {"Int32": "<i", "Int64": "<q"}
-            with open(table_file_path + ".json") as f:
-                meta = json.load(f)
-            column_names, column_types, nullable = parse_csv_meta(meta)
-            data = pd.read_csv(
-                table_file_path, header=None, names=column_names, dtype=column_types, keep_default_na=False
-            )
-            all_column_files = list()
-            for column_name in column_names:
-                t_id = 0
-                binary_file_path = f"{data_path}/{table_name}.{column_name}.bin"
-                all_column_files.append(f"'{binary_file_path}'")
-
-                if not os.path.isfile(binary_file_path):
-                    with open(binary_file_path, "wb") as f:
-                        if column_types[column_name] == "string":
-                            for value in data[column_name].values:
-                                t_id = t_id + 1
-                                if pd.isna(value):
-                                    assert nullable[column_name], f"{column_name} NULL in L{t_id}"
-                                    f.write(b"\x80")
-                                else:
-                                    f.write(value.encode())
-                                f.write(b"\x00")
-                        else:
-                            binary_type = binary_data_types[column_types[column_name]]
-                            s = struct.Struct(binary_type)
-                            for value in data[column_name].values:
-                                t_id = t_id + 1
-                                if pd.isna(value):
-                                    assert nullable[column_name], f"{column_name} NULL in L{t_id}"
-                                    assert column_types[column_name] == "Int32"
-                                    f.write(b"\x00\x00\x00\x80")
-                                else:
-                                    f.write(s.pack(value))
-
+            # MonetDB does not like some IMDB CSV files, so we load their binary encoding, which we created before.
+            column_files = monetdb_binary.column_files(data_path, table_name)
+            location = "SERVER"
+            if args.load_mode == "client":
+                column_files = [os.path.basename(column_file) for column_file in column_files]
+                location = "CLIENT"
+            all_column_files = [f"'{column_file}'" for column_file in column_files]
             cursor.execute(
-                """COPY LITTLE ENDIAN BINARY INTO "{}" FROM {} ON SERVER;""".format(
-                    table_name, ", ".join(all_column_files)
+                """COPY LITTLE ENDIAN BINARY INTO "{}" FROM {} ON {};""".format(
+                    table_name, ", ".join(all_column_files), location
                 )
             )
 
+        elif args.dbms == "monetdb" and args.load_mode == "client":
+            cursor.execute(load_command.format(table_name, os.path.basename(table_file_path)))
+
+        elif args.dbms in ["umbra", "greenplum"] and args.load_mode == "client":
+            # The file is decompressed in a background thread and streamed to the DBMS.
+            stream_load.copy_from_stdin(cursor, load_command.format(table_name), table_file_path)
+
         elif args.dbms not in ["hana", "hana-int"]:
             cursor.execute(load_command.format(table_name, table_file_path))
 
@@ -601,38 +888,9 @@ def import_data():
                     print("\nFailed to import table {}... with exception {}".format(table_name, e))
                     pass
             else:
-                # HANA seems to have issues with some JOB tables, so we rewrite the CSVs with a delimiter that does not
-                # occur in any file using pandas. The HANA documentation suggests to use '\u0007'. To be on the safe
-                # side, we also use '\u0010' as quoting char because the files contain a lot of double quotes.
+                # HANA seems to have issues with some JOB tables, so we load CSVs with a delimiter that does not occur
+                # in any file, which we transcoded before (see helpers/encode.py).
                 new_file_path = f"{data_path}/{table_name}.hana.csv"
-                if (not os.path.isfile(new_file_path)) or True:
-                    with open(table_file_path + ".json") as f:
-                        meta = json.load(f)
-                    column_names, column_types, nullable = parse_csv_meta(meta)
-                    data = pd.read_csv(
-                        table_file_path, header=None, names=column_names, dtype=column_types, keep_default_na=False
-                    )
-                    # remove failing tuples that we already inserted via SQL
-                    if table_name == "title":
-                        data = data[(data.id != 9795) & (data.id != 2162886)]
-                    if table_name == "char_name":
-                        data = data[data.id != 590883]
-                    data.to_csv(
-                        new_file_path,
-                        sep="\u0007",
-                        header=False,
-                        index=False,
-                        escapechar="+",
-                        quoting=csv.QUOTE_NONE,
-                        quotechar='"',
-                    )
-
-                    data = None
-                    with open(new_file_path) as f:
-                        data = f.read()
-                    data = data.replace('"', '+"').replace("\u0007Null\u0007", '\u0007"Null"\u0007')
-                    with open(new_file_path, "w") as f:
-                        f.write(data)
                 import_statement = "IMPORT FROM CSV FILE '{}' INTO {} WITH FIELD DELIMITED BY '\\u0007' ESCAPE '+' FAIL ON INVALID DATA;"  # noqa: E501
                 try:
                     cursor.execute(import_statement.format(new_file_path, table))
@@ -646,12 +904,55 @@ def import_data():
                 print("\nCould not merge delta of table {}... with exception {}".format(table_name, e))
                 pass
 
-        if not has_binary and args.dbms in ["hyrise", "hyrise-int"]:
-            print("and cache as binary ...", end=" ", flush=True)
-            cursor.execute(f"""COPY "{table_name}" TO '{binary_file_path}';""")
+        return time.perf_counter() - start
 
-        end = time.perf_counter()
-        print(f"({round(end - start, 1)} s)")
+    if args.dbms == "monetdb":
+        # Encode the JOB tables in MonetDB's binary format before loading. This happens in parallel and only for tables
+        # whose CSV files changed since the last encoding.
+        encoding_start = time.perf_counter()
+        job_tables = [table_name for table_name in table_order if table_name in tables["JOB"]]
+        encoded_tables = monetdb_binary.encode_tables(data_path, job_tables, args.cores)
+        encoding_end = time.perf_counter()
+        print(f"- Encoded {len(encoded_tables)} tables in binary format ({round(encoding_end - encoding_start, 1)} s)")
+
+    if args.dbms in ["hyrise", "hyrise-int"]:
+        # Hyrise loads its binary format much faster than CSV. We convert the CSV files offline and in parallel, and
+        # only if they (or the binary format) changed since the last conversion.
+        conversion_start = time.perf_counter()
+        converted_tables = hyrise_binary.build_tables(data_path, table_order, args.cores)
+        conversion_end = time.perf_counter()
+        print(f"- Converted {len(converted_tables)} tables to binary ({round(conversion_end - conversion_start, 1)} s)")
+
+    if args.dbms in ["hana", "hana-int"]:
+        transcoding_start = time.perf_counter()
+        job_tables = [table_name for table_name in table_order if table_name in tables["JOB"]]
+        # Remove failing tuples that we already inserted via SQL.
+        excluded_ids = {"title": [9795, 2162886], "char_name": [590883]}
+        transcoded_tables = encode.transcode_tables(data_path, job_tables, excluded_ids, args.cores)
+        transcoding_end = time.perf_counter()
+        print(
+            f"- Transcoded {len(transcoded_tables)} tables for HANA ({round(transcoding_end - transcoding_start, 1)} s)"
+        )
+
+    load_start = time.perf_counter()
+    if args.load_parallelism > 1:
+        load_durations = load_tables_in_parallel(table_order, import_table)
+    else:
+        load_durations = {}
+        for t_id, table_name in enumerate(table_order):
+            table_file_path = table_source(table_name)
+            print(
+                f" - ({t_id + 1}/{len(table_order)}) Import {table_name} from {table_file_path} ...",
+                end=" ",
+                flush=True,
+            )
+            load_durations[table_name] = import_table(cursor, table_name)
+            print(f"({round(load_durations[table_name], 1)} s)")
+    load_end = time.perf_counter()
+    print(
+        f"- Loaded {len(table_order)} tables ({round(load_end - load_start, 1)} s, "
+        f"{round(sum(load_durations.values()), 1)} s summed up over all tables)"
+    )
 
     cursor.close()
     if args.dbms in ["umbra", "greenplum"]:
@@ -663,7 +964,19 @@ def split_query(query):
     return [statement for statement in query.split(";") if statement.strip()]
 
 
-def loop(thread_id, queries, query_id, start_time, successful_runs, timeout, is_warmup=False):
+def loop(
+    thread_id,
+    queries,
+    query_id,
+    start_time,
+    successful_runs,
+    timeout,
+    is_warmup=False,
+    query_runs=None,
+    converged=None,
+    recorded_runs=None,
+    canceled_runs=None,
+):
     connection, cursor = get_cursor()
 
     if is_warmup:
@@ -683,64 +996,218 @@ def loop(thread_id, queries, query_id, start_time, successful_runs, timeout, is_
         connection.close()
         return
 
+    deadline_passed = threading.Event()
+    client_stopped = threading.Event()
+    deadline_timer = None
+    if args.cancel_at_deadline:
+        deadline_timer = threading.Timer(
+            start_time + timeout - time.perf_counter(),
+            cancel_at_deadline,
+            args=(connection, deadline_passed, client_stopped),
+        )
+        deadline_timer.daemon = True
+        deadline_timer.start()
+
+    permutation = 0
     while True:
         if query_id == "shuffled":
-            items = queries.copy()
+            items = list(range(len(queries)))
             random.shuffle(items)
         else:
-            items = [queries[query_id - 1]]
-        if args.dbms in ["hana", "hana-int"]:
-            split_items = []
-            for item in items:
-                split_items += split_query(item)
-            items = split_items
+            items = [query_id - 1]
+        item_runs = []
+        canceled = False
         item_start_time = time.perf_counter()
-        for query in items:
-            cursor.execute(query)
-            cursor.fetchall()
+        for item in items:
+            if deadline_passed.is_set():
+                canceled = True
+                break
+            query_start_time = time.perf_counter()
+            statements = split_query(queries[item]) if args.dbms in ["hana", "hana-int"] else [queries[item]]
+            try:
+                for query in statements:
+                    cursor.execute(query)
+                    cursor.fetchall()
+                    # The deadline might have passed right before the statement started, i.e., while nothing could be
+                    # canceled.
+                    if deadline_passed.is_set():
+                        break
+            except Exception as e:
+                if not deadline_passed.is_set():
+                    client_stopped.set()
+                    raise e
+            if deadline_passed.is_set():
+                # The query was canceled (or ended) after the deadline. Its runtime so far is a lower bound, which we
+                # keep separately from the runs.
+                if canceled_runs is not None:
+                    canceled_runs.append((thread_id, item, (time.perf_counter() - query_start_time) * 1000))
+                canceled = True
+                break
+            item_runs.append((item, (time.perf_counter() - query_start_time) * 1000))
         item_end_time = time.perf_counter()
 
-        if (item_end_time - start_time < timeout) or len(successful_runs) == 0:
+        if canceled:
+            # The item was interrupted at the end of the measurement window, so we drop it.
+            break
+
+        in_window = item_end_time - start_time < timeout
+        if count_run(recorded_runs, successful_runs, in_window):
             successful_runs.append((item_end_time - item_start_time) * 1000)
+            # In shuffled runs, we additionally record each query of the permutation to see how single queries behave
+            # under concurrency.
+            if query_id == "shuffled" and query_runs is not None:
+                for position, (item, runtime) in enumerate(item_runs):
+                    query_runs[item].append(runtime, (thread_id, permutation, position, item, runtime))
+            permutation += 1
+            if not in_window:
+                break
+            # With adaptive stopping, we end the measurement early once the runtimes are stable.
+            if converged is not None and item_end_time - start_time >= args.min_time and converged(successful_runs):
+                break
         else:
             break
 
-    cursor.close()
-    connection.close()
+    client_stopped.set()
+    if deadline_timer:
+        deadline_timer.cancel()
+    try:
+        cursor.close()
+        connection.close()
+    except Exception as e:
+        # Connections whose statement was canceled might already be unusable.
+        if not deadline_passed.is_set():
+            raise e
 
 
-if args.benchmark == "TPCH":
-    selected_benchmark_queries = tpch_queries
-elif args.benchmark == "TPCDS":
-    selected_benchmark_queries = tpcds_queries
-elif args.benchmark == "SSB":
-    selected_benchmark_queries = ssb_queries
-elif args.benchmark == "JOB":
-    selected_benchmark_queries = job_queries
-elif args.benchmark == "all":
-    selected_benchmark_queries = tpch_queries + tpcds_queries + ssb_queries + job_queries
+def count_run(recorded_runs, successful_runs, in_window):
+    # Runs that end after the measurement window are only recorded if there is no run at all yet, so that each item has
+    # at least one sample. With multiple clients, recorded_runs is the shared number of recorded runs of all clients.
+    if recorded_runs is None:
+        return in_window or len(successful_runs) == 0
+    with recorded_runs.get_lock():
+        if in_window or recorded_runs.value == 0:
+            recorded_runs.value += 1
+            return True
+    return False
 
 
-if args.dbms == "monetdb":
-    selected_benchmark_queries = [
-        q.replace("!=", "<>")
-        .replace("SELECT MIN(chn.name) AS character,", 'SELECT MIN(chn.name) AS "character",')
-        .replace("ss_list_price BETWEEN 122 AND 122+10", "ss_list_price BETWEEN 122 AND 122+10.0")
-        for q in selected_benchmark_queries
-    ]
+def cancel_statement(connection):
+    if args.dbms == "monetdb":
+        # pymonetdb cannot cancel queries, so we shut the socket down, which lets the pending read fail.
+        connection.mapi.socket.shutdown(socket.SHUT_RDWR)
+    elif args.dbms == "duckdb":
+        connection.interrupt()
+    else:
+        # Both psycopg2 and hdbcli connections can cancel the running statement from another thread.
+        connection.cancel()
+
+
+def cancel_at_deadline(connection, deadline_passed, client_stopped, interval=0.1):
+    # We cancel even if the client has no run yet, so the measurement ends on time. Its canceled query is recorded as
+    # a canceled run instead (see loop()).
+    if client_stopped.is_set():
+        return
+    deadline_passed.set()
+    # A cancel does nothing if the client is just about to start a statement. Thus, we cancel until the client stopped.
+    attempt = 0
+    while not client_stopped.is_set():
+        try:
+            cancel_statement(connection)
+        except Exception as e:
+            # Canceling again fails for connections that became unusable by the first cancel (e.g., for MonetDB) or
+            # that the client closed in the meantime.
+            if attempt == 0 and not client_stopped.is_set():
+                print(f"\nCould not cancel running statement: {e}")
+        attempt += 1
+        client_stopped.wait(interval)
+
+
+def process_loop(thread_id, queries, query_id, start_time, timeout, recorded_runs, sender, cpu):
+    # Each client process has its own interpreter and connection. The measurements are sent to the parent in bulk once
+    # the client is done, so the pipe does not add overhead while the queries are running.
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    successful_runs = new_recorder()
+    query_runs = defaultdict(new_recorder)
+    canceled_runs = []
+    try:
+        loop(
+            thread_id,
+            queries,
+            query_id,
+            start_time,
+            successful_runs,
+            timeout,
+            query_runs=query_runs,
+            recorded_runs=recorded_runs,
+            canceled_runs=canceled_runs,
+        )
+    finally:
+        sender.send((successful_runs, query_runs, canceled_runs))
+        sender.close()
+
+
+# We fork the client processes so they inherit the parsed arguments and the query sets without re-executing this script.
+process_context = multiprocessing.get_context("fork")
+
+
+def start_client(
+    thread_id, queries, query_id, start_time, successful_runs, query_runs, canceled_runs, timeout, recorded_runs
+):
+    if args.client_mode == "thread":
+        client = threading.Thread(
+            target=loop,
+            args=(thread_id, queries, query_id, start_time, successful_runs, timeout),
+            kwargs={"query_runs": query_runs, "recorded_runs": recorded_runs, "canceled_runs": canceled_runs},
+        )
+        client.start()
+        return client, None
+
+    cpu = client_cpus[thread_id % len(client_cpus)] if client_cpus else None
+    receiver, sender = process_context.Pipe(duplex=False)
+    client = process_context.Process(
+        target=process_loop, args=(thread_id, queries, query_id, start_time, timeout, recorded_runs, sender, cpu)
+    )
+    client.start()
+    sender.close()
+    return client, receiver
+
+
+def collect_client_results(receivers, client_runs, client_query_runs, client_canceled_runs):
+    # Client processes block when sending results that exceed the pipe's buffer, so we have to read them while waiting.
+    for receiver in multiprocessing.connection.wait(list(receivers), timeout=1):
+        thread_id = receivers.pop(receiver)
+        try:
+            client_runs[thread_id], client_query_runs[thread_id], client_canceled_runs[thread_id] = receiver.recv()
+        except EOFError:
+            pass
 
-drop_constraints(args.dbms in ["umbra", "hyrise", "hyrise-int"])
+
+def new_recorder():
+    return latency_histogram.LatencyRecorder(args.raw_samples, args.reservoir_size)
+
+
+required_tables = None
+if not args.load_all_tables:
+    # Only create and load the tables that the selected queries read and their foreign key targets.
+    all_tables = set(schema_tables()[0])
+    required_tables = query_tables.required_tables(
+        selected_benchmark_queries + baseline_benchmark_queries, all_tables, schema_keys.foreign_keys
+    )
+
+drop_constraints(args.dbms in ["umbra", "hyrise", "hyrise-int", "duckdb"])
 
 if not args.skip_data_loading:
     import_data()
 
 if args.schema_keys or args.dbms == "hana-int":
-    add_constraints(args.dbms in ["umbra", "hyrise", "hyrise-int"])
+    add_constraints(args.dbms in ["umbra", "hyrise", "hyrise-int", "duckdb"])
 
 if args.dbms in ["monetdb", "umbra", "greenplum", "hyrise-int"] or (args.dbms == "hyrise" and args.schema_keys):
     print("Warming up database (complete single-threaded run) due to initial persistence on disk: ", end="")
     sys.stdout.flush()
-    loop(0, selected_benchmark_queries, "warmup", time.perf_counter(), [], 3600, True)
+    warmup_queries = selected_benchmark_queries + [baseline_benchmark_queries[item] for item in paired_items]
+    loop(0, warmup_queries, "warmup", time.perf_counter(), [], 3600, True)
     print(" done.")
     sys.stdout.flush()
 
@@ -754,93 +1221,462 @@ if args.dbms == "hyrise-int" or (args.dbms == "hyrise" and args.schema_keys):
         )
     )
     cursor.execute("INSERT INTO meta_exec values ('hyriseDependencyDiscoveryPlugin', 'DiscoverDependencies');")
-    print(" done.")
+    # The plugin reports how long the discovery took in the server's output.
+    discovery_event = dbms_log.wait_for("dependency_discovery", timeout=10)
+    print(f" done ({discovery_event[3]})." if discovery_event else " done.")
     cursor.close()
     connection.close()
 
 os.makedirs("db_comparison_results", exist_ok=True)
 
-runtimes = {}
-benchmark_queries = list(range(1, len(selected_benchmark_queries) + 1))
 
-if args.clients > 1:
-    benchmark_queries = ["shuffled"]
-for query_id in benchmark_queries:
-    query_name = "{} {:02}".format(args.benchmark, query_id) if query_id != "shuffled" else "shuffled"
-    print("Benchmarking {}...".format(query_name), end="", flush=True)
+def benchmark_adaptively(query_ids, runtimes, histograms):
+    # First, every query gets its fair share of the time budget and stops early if the CI is narrow enough. Then, the
+    # time saved by converged queries is handed to the queries with the widest CIs.
+    time_budget = args.time_budget or args.time * len(query_ids)
+    recorders = {query_id: new_recorder() for query_id in query_ids}
+    durations = defaultdict(float)
+    time_left = time_budget
+
+    def converged(runs):
+        return runs.histogram.relative_confidence_interval(args.adaptive_statistic) <= args.target_ci
+
+    def measure(query_id, allowance):
+        start_time = time.perf_counter()
+        loop(0, selected_benchmark_queries, query_id, start_time, recorders[query_id], allowance, converged=converged)
+        duration = time.perf_counter() - start_time
+        durations[query_id] += duration
+        return duration
+
+    def print_result(query_id):
+        print("\r" + " " * 80, end="")
+        print(
+            "\r{}\t>>\t med.: {:10.4f} ms\truns: {:8}\tCI: {:6.2%}\ttime: {:6.1f} s".format(
+                "{} {:02}".format(args.benchmark, query_id),
+                recorders[query_id].histogram.percentile(50),
+                len(recorders[query_id]),
+                recorders[query_id].histogram.relative_confidence_interval(args.adaptive_statistic),
+                durations[query_id],
+            )
+        )
+
+    for position, query_id in enumerate(query_ids):
+        query_name = "{} {:02}".format(args.benchmark, query_id)
+        fair_share = time_left / (len(query_ids) - position)
+        allowance = min(args.max_time, max(args.min_time, fair_share))
+        print("Benchmarking {}... up to {:.0f} seconds".format(query_name, allowance), end="", flush=True)
+        time_left -= measure(query_id, allowance)
+        print_result(query_id)
+
+    unstable_queries = [query_id for query_id in query_ids if not converged(recorders[query_id])]
+    unstable_queries.sort(
+        key=lambda query_id: recorders[query_id].histogram.relative_confidence_interval(args.adaptive_statistic),
+        reverse=True,
+    )
+    for position, query_id in enumerate(unstable_queries):
+        query_name = "{} {:02}".format(args.benchmark, query_id)
+        allowance = min(args.max_time - durations[query_id], time_left / (len(unstable_queries) - position))
+        if allowance < 1:
+            continue
+        print("Continuing {}... up to {:.0f} seconds".format(query_name, allowance), end="", flush=True)
+        time_left -= measure(query_id, allowance)
+        print_result(query_id)
 
-    successful_runs = []
-    start_time = time.perf_counter()
+    for query_id in query_ids:
+        query_name = "{} {:02}".format(args.benchmark, query_id)
+        histograms.append((query_name, query_name, -1, recorders[query_id].histogram))
+        runtimes[query_name] = recorders[query_id]
+    print(f"Used {round(time_budget - time_left)} s of the {time_budget} s time budget.")
 
-    timeout = args.time
 
-    threads = []
-    for thread_id in range(0, args.clients):
-        threads.append(
-            threading.Thread(
-                target=loop,
-                args=(thread_id, selected_benchmark_queries, query_id, start_time, successful_runs, timeout),
+def execute_query(cursor, query):
+    start_time = time.perf_counter()
+    statements = split_query(query) if args.dbms in ["hana", "hana-int"] else [query]
+    for statement in statements:
+        cursor.execute(statement)
+        cursor.fetchall()
+    return (time.perf_counter() - start_time) * 1000
+
+
+def benchmark_paired():
+    # The original and the rewritten variant of a query run back-to-back in alternating order (original first in even
+    # pairs, rewritten first in odd pairs) on the same connection. Thus, both variants see the same server state,
+    # caches, and background noise, and drift over time cancels out in the per-pair speedups. Queries that the rewrites
+    # do not change are not measured.
+    variant_name = "rewrites" if args.rewrites else "+".join(name for name in ["O1", "O3"] if getattr(args, name))
+    connection, cursor = get_cursor()
+    pairs = {}
+    print(f"Comparing {len(paired_items)} of {len(selected_query_names)} queries changed by {variant_name}.")
+    for item in paired_items:
+        query_name = selected_query_names[item]
+        variants = [("original", baseline_benchmark_queries[item]), (variant_name, selected_benchmark_queries[item])]
+        print("Benchmarking {}... up to {} seconds".format(query_name, args.time), end="", flush=True)
+        pairs[query_name] = []
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < args.time or not pairs[query_name]:
+            original_first = len(pairs[query_name]) % 2 == 0
+            runtimes = {}
+            for name, query in variants if original_first else reversed(variants):
+                runtimes[name] = execute_query(cursor, query)
+            pairs[query_name].append((original_first, runtimes["original"], runtimes[variant_name]))
+
+        _, original_runtimes, variant_runtimes = zip(*pairs[query_name])
+        speedup, lower, upper = latency_histogram.paired_speedup(original_runtimes, variant_runtimes)
+        print("\r" + " " * 80, end="")
+        print(
+            "\r{}\t>>\t speedup: {:6.3f}x\tCI: [{:6.3f}, {:6.3f}]\tpairs: {:8}".format(
+                query_name, speedup, lower, upper, len(pairs[query_name])
             )
         )
-        threads[-1].start()
+    cursor.close()
+    connection.close()
 
-    while True:
-        time_left = start_time + timeout - time.perf_counter()
-        if time_left < 0:
-            break
-        print("\rBenchmarking {}... {:.0f} seconds left".format(query_name, time_left), end="")
-        time.sleep(1)
+    pair_csv_filename = result_file_prefix() + "__paired.csv"
+    pair_csv_exists = Path(pair_csv_filename).exists()
+    with open(pair_csv_filename, "a" if pair_csv_exists else "w") as pair_csv:
+        if not pair_csv_exists:
+            pair_csv.write(
+                "BENCHMARK,DATABASE_SYSTEM,CORES,VARIANT,QUERY_NAME,PAIR,ORIGINAL_FIRST,ORIGINAL_MS,VARIANT_MS\n"
+            )
+        for query_name, query_pairs in pairs.items():
+            for pair_id, (original_first, original_runtime, variant_runtime) in enumerate(query_pairs):
+                pair_csv.write(
+                    "{},{},{},{},{},{},{},{},{}\n".format(
+                        args.benchmark,
+                        args.dbms,
+                        args.cores,
+                        variant_name,
+                        query_name,
+                        pair_id,
+                        original_first,
+                        original_runtime,
+                        variant_runtime,
+                    )
+                )
 
-    while True:
-        joined_threads = 0
-        for thread_id in range(0, args.clients):
-            if not threads[thread_id].is_alive():
-                # print(f't{thread_id} finished')
-                joined_threads += 1
+    speedup_csv_filename = result_file_prefix() + "__paired_speedups.csv"
+    speedup_csv_exists = Path(speedup_csv_filename).exists()
+    with open(speedup_csv_filename, "a" if speedup_csv_exists else "w") as speedup_csv:
+        if not speedup_csv_exists:
+            speedup_csv.write(
+                "BENCHMARK,DATABASE_SYSTEM,CORES,VARIANT,QUERY_NAME,PAIRS,ORIGINAL_P50_MS,VARIANT_P50_MS,SPEEDUP,"
+                "SPEEDUP_CI_LOWER,SPEEDUP_CI_UPPER\n"
+            )
+        for query_name, query_pairs in pairs.items():
+            _, original_runtimes, variant_runtimes = zip(*query_pairs)
+            speedup, lower, upper = latency_histogram.paired_speedup(original_runtimes, variant_runtimes)
+            speedup_csv.write(
+                "{},{},{},{},{},{},{},{},{},{},{}\n".format(
+                    args.benchmark,
+                    args.dbms,
+                    args.cores,
+                    variant_name,
+                    query_name,
+                    len(query_pairs),
+                    statistics.median(original_runtimes),
+                    statistics.median(variant_runtimes),
+                    speedup,
+                    lower,
+                    upper,
+                )
+            )
 
-        if joined_threads == args.clients:
-            break
-        else:
+
+def benchmark(shuffled=False):
+    # With multiple clients (or when shuffled is set), the clients run shuffled permutations of all queries.
+    runtimes = {}
+    open_loop_samples = {}
+    shuffled_query_runs = {}
+    # Queries that were canceled at the deadline with their runtime until then, i.e., censored samples.
+    canceled_query_runs = {}
+    # (item name, query name, client id, histogram) for the percentile summary. Client id -1 denotes all clients.
+    histograms = []
+    benchmark_queries = list(range(1, len(selected_benchmark_queries) + 1))
+
+    if shuffled or args.clients > 1:
+        benchmark_queries = ["shuffled"]
+    elif args.adaptive:
+        benchmark_adaptively(benchmark_queries, runtimes, histograms)
+        benchmark_queries = []
+    for query_id in benchmark_queries:
+        query_name = "{} {:02}".format(args.benchmark, query_id) if query_id != "shuffled" else "shuffled"
+        print("Benchmarking {}...".format(query_name), end="", flush=True)
+
+        start_time = time.perf_counter()
+
+        timeout = args.time
+
+        if args.arrival_rate:
+            if query_id == "shuffled":
+                queries = dict(zip(selected_query_names, selected_benchmark_queries))
+            else:
+                queries = {query_name: selected_benchmark_queries[query_id - 1]}
             print(
-                "\rBenchmarking {}... waiting for {} more clients to finish".format(
-                    query_name, args.clients - joined_threads
-                ),
-                end="",
+                "\rBenchmarking {}... open loop with {} QPS".format(query_name, args.arrival_rate), end="", flush=True
+            )
+            samples = open_loop.run(
+                get_connection_parameters(),
+                queries,
+                args.clients,
+                args.arrival_rate,
+                args.arrival_process,
+                timeout,
+                cancel_at_deadline=args.cancel_at_deadline,
+            )
+            successful_runs = new_recorder()
+            requests = new_recorder()
+            for sample in samples:
+                successful_runs.append(sample[4])
+                requests.append(sample[4], sample)
+            open_loop_samples[query_name] = requests.samples
+            histograms.append((query_name, query_name, -1, successful_runs.histogram))
+            print("\r" + " " * 80, end="")
+            print(
+                "\r{}\t>>\t achieved: {:8.2f} QPS\tqueueing avg.: {:10.4f} ms\tlatency med.: {:10.4f} ms".format(
+                    query_name,
+                    len(samples) / timeout,
+                    sum(sample[2] for sample in samples) / len(samples) if len(samples) > 0 else 0,
+                    successful_runs.histogram.percentile(50),
+                )
+            )
+            runtimes[query_name] = successful_runs
+            continue
+
+        # Each client records into its own histograms, which we merge once all clients are done.
+        client_runs = [new_recorder() for _ in range(args.clients)]
+        client_query_runs = [defaultdict(new_recorder) for _ in range(args.clients)]
+        client_canceled_runs = [[] for _ in range(args.clients)]
+        # Shared by the clients, which only record runs after the deadline if no client recorded a run at all.
+        recorded_runs = process_context.Value("i", 0)
+        clients = []
+        receivers = {}
+        for thread_id in range(0, args.clients):
+            client, receiver = start_client(
+                thread_id,
+                selected_benchmark_queries,
+                query_id,
+                start_time,
+                client_runs[thread_id],
+                client_query_runs[thread_id],
+                client_canceled_runs[thread_id],
+                timeout,
+                recorded_runs,
             )
+            clients.append(client)
+            if receiver:
+                receivers[receiver] = thread_id
+
+        while True:
+            time_left = start_time + timeout - time.perf_counter()
+            if time_left < 0:
+                break
+            print("\rBenchmarking {}... {:.0f} seconds left".format(query_name, time_left), end="")
             time.sleep(1)
 
-    print("\r" + " " * 80, end="")
-    print(
-        "\r{}\t>>\t avg.: {:10.4f} ms\tmed.: {:10.4f} ms\tmin.: {:10.4f} ms\tmax.: {:10.4f} ms".format(
-            query_name,
-            sum(successful_runs) / len(successful_runs) if len(successful_runs) > 0 else 0,
-            statistics.median(successful_runs) if len(successful_runs) > 0 else 0,
-            min(successful_runs) if len(successful_runs) > 0 else 0,
-            max(successful_runs) if len(successful_runs) > 0 else 0,
+        while True:
+            joined_threads = 0
+            for thread_id in range(0, args.clients):
+                if not clients[thread_id].is_alive():
+                    # print(f't{thread_id} finished')
+                    joined_threads += 1
+
+            if joined_threads == args.clients and not receivers:
+                break
+            else:
+                print(
+                    "\rBenchmarking {}... waiting for {} more clients to finish".format(
+                        query_name, args.clients - joined_threads
+                    ),
+                    end="",
+                )
+                if receivers:
+                    collect_client_results(receivers, client_runs, client_query_runs, client_canceled_runs)
+                else:
+                    time.sleep(1)
+
+        for client in clients:
+            client.join()
+
+        successful_runs = new_recorder()
+        query_runs = defaultdict(new_recorder)
+        for thread_id in range(0, args.clients):
+            histograms.append((query_name, query_name, thread_id, client_runs[thread_id].histogram))
+            successful_runs.merge(client_runs[thread_id])
+            for item, runs in sorted(client_query_runs[thread_id].items()):
+                histograms.append((query_name, selected_query_names[item], thread_id, runs.histogram))
+                query_runs[item].merge(runs)
+        histograms.append((query_name, query_name, -1, successful_runs.histogram))
+        for item, runs in sorted(query_runs.items()):
+            histograms.append((query_name, selected_query_names[item], -1, runs.histogram))
+
+        print("\r" + " " * 80, end="")
+        print(
+            "\r{}\t>>\t avg.: {:10.4f} ms\tmed.: {:10.4f} ms\tmin.: {:10.4f} ms\tmax.: {:10.4f} ms".format(
+                query_name,
+                successful_runs.histogram.mean(),
+                successful_runs.histogram.percentile(50),
+                successful_runs.histogram.min if len(successful_runs) > 0 else 0,
+                successful_runs.histogram.max if len(successful_runs) > 0 else 0,
+            )
         )
-    )
 
-    runtimes[query_name] = successful_runs
-
-row_suffix = "-rows" if args.rows else ""
-rewrite_suffix = ""
-if args.O1:
-    rewrite_suffix += "__O1"
-if args.O3:
-    rewrite_suffix += "__O3"
-if args.rewrites:
-    rewrite_suffix += "__rewrites"
-if args.schema_keys:
-    rewrite_suffix += "__keys"
-result_csv_filename = "db_comparison_results/database_comparison__{}__{}{}{}.csv".format(
-    args.benchmark, args.dbms, row_suffix, rewrite_suffix
-)
-result_csv_exists = Path(result_csv_filename).exists()
-with open(result_csv_filename, "a" if result_csv_exists else "w") as result_csv:
-    if not result_csv_exists:
-        result_csv.write("BENCHMARK,DATABASE_SYSTEM,CORES,CLIENTS,ITEM_NAME,RUNTIME_MS\n")
-    for item_name, runs in runtimes.items():
-        for run in runs:
-            result_csv.write(
-                "{},{},{},{},{},{}\n".format(args.benchmark, args.dbms, args.cores, args.clients, item_name, run)
+        runtimes[query_name] = successful_runs
+        if query_runs:
+            shuffled_query_runs[query_name] = [run for runs in query_runs.values() for run in runs.samples]
+        canceled_runs = [run for runs in client_canceled_runs for run in runs]
+        if canceled_runs:
+            print(f"- {len(canceled_runs)} queries were canceled at the deadline")
+            canceled_query_runs[query_name] = canceled_runs
+
+    result_csv_filename = result_file_prefix() + ".csv"
+    result_csv_exists = Path(result_csv_filename).exists()
+    with open(result_csv_filename, "a" if result_csv_exists else "w") as result_csv:
+        if not result_csv_exists:
+            result_csv.write("BENCHMARK,DATABASE_SYSTEM,CORES,CLIENTS,ITEM_NAME,RUNTIME_MS\n")
+        for item_name, runs in runtimes.items():
+            for run in runs.samples:
+                result_csv.write(
+                    "{},{},{},{},{},{}\n".format(args.benchmark, args.dbms, args.cores, args.clients, item_name, run)
+                )
+
+    if shuffled_query_runs:
+        # The runtimes of all queries within the shuffled permutations, i.e., one row per executed query.
+        query_csv_filename = result_csv_filename[: -len(".csv")] + "__queries.csv"
+        query_csv_exists = Path(query_csv_filename).exists()
+        with open(query_csv_filename, "a" if query_csv_exists else "w") as query_csv:
+            if not query_csv_exists:
+                query_csv.write(
+                    "BENCHMARK,DATABASE_SYSTEM,CORES,CLIENTS,ITEM_NAME,CLIENT_ID,PERMUTATION,POSITION,QUERY_NAME,"
+                    "RUNTIME_MS\n"
+                )
+            for item_name, runs in shuffled_query_runs.items():
+                for client_id, permutation, position, q_id, runtime in runs:
+                    query_csv.write(
+                        "{},{},{},{},{},{},{},{},{},{}\n".format(
+                            args.benchmark,
+                            args.dbms,
+                            args.cores,
+                            args.clients,
+                            item_name,
+                            client_id,
+                            permutation,
+                            position,
+                            selected_query_names[q_id],
+                            runtime,
+                        )
+                    )
+
+    if canceled_query_runs:
+        canceled_csv_filename = result_csv_filename[: -len(".csv")] + "__canceled.csv"
+        canceled_csv_exists = Path(canceled_csv_filename).exists()
+        with open(canceled_csv_filename, "a" if canceled_csv_exists else "w") as canceled_csv:
+            if not canceled_csv_exists:
+                canceled_csv.write(
+                    "BENCHMARK,DATABASE_SYSTEM,CORES,CLIENTS,ITEM_NAME,CLIENT_ID,QUERY_NAME,ELAPSED_MS\n"
+                )
+            for item_name, runs in canceled_query_runs.items():
+                for client_id, q_id, elapsed in runs:
+                    canceled_csv.write(
+                        "{},{},{},{},{},{},{},{}\n".format(
+                            args.benchmark,
+                            args.dbms,
+                            args.cores,
+                            args.clients,
+                            item_name,
+                            client_id,
+                            selected_query_names[q_id],
+                            elapsed,
+                        )
+                    )
+
+    if args.arrival_rate:
+        # In open-loop mode, RUNTIME_MS is the latency from the scheduled arrival. We additionally store how it splits
+        # into waiting for a free session and the actual execution.
+        open_loop_csv_filename = result_csv_filename[: -len(".csv")] + "__requests.csv"
+        open_loop_csv_exists = Path(open_loop_csv_filename).exists()
+        with open(open_loop_csv_filename, "a" if open_loop_csv_exists else "w") as open_loop_csv:
+            if not open_loop_csv_exists:
+                open_loop_csv.write(
+                    "BENCHMARK,DATABASE_SYSTEM,CORES,CLIENTS,TARGET_QPS,ARRIVAL_PROCESS,RUN_NAME,ITEM_NAME,"
+                    "SCHEDULED_S,QUEUEING_MS,SERVICE_MS,LATENCY_MS\n"
+                )
+            for run_name, samples in open_loop_samples.items():
+                for item_name, scheduled, queueing, service, latency in samples:
+                    open_loop_csv.write(
+                        "{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
+                            args.benchmark,
+                            args.dbms,
+                            args.cores,
+                            args.clients,
+                            args.arrival_rate,
+                            args.arrival_process,
+                            run_name,
+                            item_name,
+                            scheduled,
+                            queueing,
+                            service,
+                            latency,
+                        )
+                    )
+
+    # Percentiles from the latency histograms. Unlike the raw samples, they are always complete.
+    percentile_csv_filename = result_csv_filename[: -len(".csv")] + "__percentiles.csv"
+    percentile_csv_exists = Path(percentile_csv_filename).exists()
+    with open(percentile_csv_filename, "a" if percentile_csv_exists else "w") as percentile_csv:
+        if not percentile_csv_exists:
+            percentile_csv.write(
+                "BENCHMARK,DATABASE_SYSTEM,CORES,CLIENTS,ITEM_NAME,QUERY_NAME,CLIENT_ID,COUNT,MEAN_MS,MIN_MS,MAX_MS,"
+                "P50_MS,P95_MS,P99_MS,P99_9_MS\n"
             )
+        for item_name, query_name, client_id, histogram in histograms:
+            if histogram.count == 0:
+                continue
+            percentile_csv.write(
+                "{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
+                    args.benchmark,
+                    args.dbms,
+                    args.cores,
+                    args.clients,
+                    item_name,
+                    query_name,
+                    client_id if client_id >= 0 else "all",
+                    histogram.count,
+                    histogram.mean(),
+                    histogram.min,
+                    histogram.max,
+                    histogram.percentile(50),
+                    histogram.percentile(95),
+                    histogram.percentile(99),
+                    histogram.percentile(99.9),
+                )
+            )
+
+
+def write_server_events():
+    # Events parsed from the server's output (e.g., plugin messages and the duration of the dependency discovery).
+    events_csv_filename = result_file_prefix() + "__server_events.csv"
+    events_csv_exists = Path(events_csv_filename).exists()
+    with open(events_csv_filename, "a" if events_csv_exists else "w", newline="") as events_csv:
+        writer = csv.writer(events_csv)
+        if not events_csv_exists:
+            writer.writerow(["BENCHMARK", "DATABASE_SYSTEM", "CORES", "TIMESTAMP", "STREAM", "EVENT", "VALUE"])
+        for timestamp, stream_name, event, value in list(dbms_log.events):
+            writer.writerow([args.benchmark, args.dbms, args.cores, timestamp, stream_name, event, value])
+    print(f"Server log written to {dbms_log.file.name}")
+
+
+if args.paired:
+    benchmark_paired()
+elif args.clients_sweep:
+    # The data is loaded and the database is warmed up only once for all client counts.
+    for client_count in client_counts:
+        args.clients = client_count
+        print(f"Running with {client_count} client{'s' if client_count > 1 else ''}.")
+        # All points of the sweep run shuffled permutations, including the one with a single client. Otherwise, it
+        # would run each query for --time and its results would not be comparable to the other points.
+        benchmark(shuffled=True)
+else:
+    benchmark()
+
+if dbms_log:
+    write_server_events()
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+import argparse as ap
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from helpers import stream_load
+from helpers.csv_meta import load_csv_meta
+
+# Every table is parsed from CSV once and stored as one directory of NumPy arrays per table. Numeric columns are stored
+# as typed arrays, string columns as a UTF-8 heap plus offsets (like Arrow's string layout). Nullable columns have an
+# additional boolean NULL mask. All arrays can be memory-mapped, so deriving load formats does not copy or parse data.
+# Tables may exist only as compressed CSV files (see helpers/stream_load.py), which are decompressed while parsing.
+# The cache is built on demand by the loaders. To build it upfront, run from the repository root:
+#   PYTHONPATH=python python3 python/helpers/column_cache.py
+numeric_types = {"Int32": "<i4", "Int64": "<i8", "Float32": "<f4", "Float64": "<f8"}
+cache_version = 1
+
+
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument("tables", type=str, nargs="*", help="Tables to cache, defaults to all CSV files")
+    parser.add_argument("--data_path", "-d", type=str, default="resources/experiment_data")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+
+def table_cache_path(data_path, table_name):
+    return os.path.join(data_path, "column_cache", table_name)
+
+
+def table_source_path(data_path, table_name):
+    # The (possibly compressed) CSV file of the table. Its metadata is always next to the plain CSV file's name.
+    table_file_path = stream_load.source_file_path(os.path.join(data_path, f"{table_name}.csv"))
+    if table_file_path is None:
+        raise FileNotFoundError(f"Found no CSV file (plain, .zst, or .gz) of {table_name} in {data_path}")
+    return table_file_path
+
+
+def list_tables(data_path):
+    # Tables are identified by their metadata files, so compressed-only tables are included.
+    suffix = ".csv.json"
+    return sorted(file_name[: -len(suffix)] for file_name in os.listdir(data_path) if file_name.endswith(suffix))
+
+
+def source_stamp(table_file_path):
+    stat = os.stat(table_file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "version": cache_version}
+
+
+def read_cache_meta(data_path, table_name):
+    meta_file_path = os.path.join(table_cache_path(data_path, table_name), "meta.json")
+    if not os.path.isfile(meta_file_path):
+        return None
+    with open(meta_file_path) as f:
+        return json.load(f)
+
+
+def is_cached(data_path, table_name):
+    meta = read_cache_meta(data_path, table_name)
+    return meta is not None and meta["source"] == source_stamp(table_source_path(data_path, table_name))
+
+
+def store_column(cache_path, column_name, values, data_type):
+    null_mask = values.isna().to_numpy()
+    if null_mask.any():
+        np.save(os.path.join(cache_path, f"{column_name}.null.npy"), null_mask)
+
+    if data_type == "string":
+        encoded = values.str.encode("utf-8").to_numpy(dtype=object, copy=True)
+        encoded[null_mask] = b""
+        lengths = np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(os.path.join(cache_path, f"{column_name}.offsets.npy"), offsets)
+        np.save(os.path.join(cache_path, f"{column_name}.heap.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        return
+
+    binary_type = numeric_types[data_type]
+    null_value = np.nan if data_type.startswith("Float") else 0
+    np.save(os.path.join(cache_path, f"{column_name}.npy"), values.to_numpy(dtype=binary_type, na_value=null_value))
+
+
+def build_table_cache(data_path, table_name):
+    """Parse the table's CSV file and store it in the column cache. Returns whether the cache had to be (re-)built."""
+    if is_cached(data_path, table_name):
+        return table_name, False
+
+    table_file_path = table_source_path(data_path, table_name)
+    stamp = source_stamp(table_file_path)
+    column_names, column_types, nullable = load_csv_meta(os.path.join(data_path, f"{table_name}.csv"))
+    # pandas decompresses .zst and .gz files on the fly.
+    data = pd.read_csv(
+        table_file_path,
+        header=None,
+        names=column_names,
+        dtype=column_types,
+        keep_default_na=False,
+        compression="infer",
+    )
+
+    # Build the cache next to the final directory and swap it in at the end, so readers never see partial caches.
+    cache_path = table_cache_path(data_path, table_name)
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    for column_name in column_names:
+        values = data[column_name]
+        assert nullable[column_name] or not values.isna().any(), f"{table_name}.{column_name} contains NULL"
+        store_column(temporary_path, column_name, values, column_types[column_name])
+
+    with open(os.path.join(temporary_path, "meta.json"), "w") as f:
+        meta = {
+            "source": stamp,
+            "row_count": len(data),
+            "columns": [
+                {"name": name, "type": column_types[name], "nullable": nullable[name]} for name in column_names
+            ],
+        }
+        json.dump(meta, f)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    try:
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        # Another process (e.g., a runner on another NUMA node) built the cache in the meantime.
+        shutil.rmtree(temporary_path, ignore_errors=True)
+    return table_name, True
+
+
+def build_cache(data_path, table_names, workers):
+    """Build the column cache for the tables in parallel. Returns the names of the tables that had to be (re-)built."""
+    built_tables = list()
+    with ProcessPoolExecutor(max_workers=max(min(workers, len(table_names)), 1)) as pool:
+        for table_name, built in pool.map(build_table_cache, [data_path] * len(table_names), table_names):
+            if built:
+                built_tables.append(table_name)
+    return built_tables
+
+
+class CachedColumn:
+    """Memory-mapped view of a cached column. For string columns, values holds the heap and offsets the value bounds."""
+
+    def __init__(self, cache_path, name, data_type, row_count):
+        self.name = name
+        self.data_type = data_type
+        self.row_count = row_count
+
+        null_file_path = os.path.join(cache_path, f"{name}.null.npy")
+        self.null_mask = np.load(null_file_path, mmap_mode="r") if os.path.isfile(null_file_path) else None
+
+        if data_type == "string":
+            self.offsets = np.load(os.path.join(cache_path, f"{name}.offsets.npy"), mmap_mode="r")
+            self.values = np.load(os.path.join(cache_path, f"{name}.heap.npy"), mmap_mode="r")
+        else:
+            self.offsets = None
+            self.values = np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode="r")
+
+    def nulls(self):
+        return self.null_mask if self.null_mask is not None else np.zeros(self.row_count, dtype=bool)
+
+
+def load_table(data_path, table_name):
+    """Return the cached columns of the table (in schema order), building the cache first if it is missing or stale."""
+    build_table_cache(data_path, table_name)
+    meta = read_cache_meta(data_path, table_name)
+    cache_path = table_cache_path(data_path, table_name)
+    return [CachedColumn(cache_path, column["name"], column["type"], meta["row_count"]) for column in meta["columns"]]
+
+
+def main(data_path, tables, workers):
+    if not tables:
+        tables = [
+            table_name
+            for table_name in list_tables(data_path)
+            if stream_load.source_file_path(os.path.join(data_path, f"{table_name}.csv"))
+        ]
+    built_tables = build_cache(data_path, tables, workers)
+    print(f"Cached {len(tables)} tables, {len(built_tables)} of them had to be parsed.")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.data_path, args.tables, args.workers)
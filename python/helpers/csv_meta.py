@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+
+import json
+
+
+def parse_data_type(type_string):
+    if type_string == "int":
+        return "Int32"
+    elif type_string == "long":
+        return "Int64"
+    elif type_string == "float":
+        return "Float32"
+    elif type_string == "double":
+        return "Float64"
+    elif type_string == "string":
+        return "string"
+    raise AttributeError(f"Unknown data type: '{type_string}'")
+
+
+def parse_csv_meta(meta):
+    column_names = list()
+    column_data_types = dict()
+    nullable = dict()
+    for column_meta in meta["columns"]:
+        column_name = column_meta["name"]
+        column_names.append(column_name)
+        column_data_types[column_name] = parse_data_type(column_meta["type"])
+        nullable[column_name] = column_meta["nullable"]
+    return column_names, column_data_types, nullable
+
+
+def load_csv_meta(table_file_path):
+    # Each CSV file comes with a .csv.json file that describes its columns.
+    with open(table_file_path + ".json") as f:
+        meta = json.load(f)
+    return parse_csv_meta(meta)
@@ -1,68 +1,300 @@
+import argparse as ap
+import hashlib
+import json
 import os
 import sys
+import threading
 import urllib.request
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
+# The archive is downloaded in ranges by multiple connections. Finished ranges are recorded in a journal next to the
+# archive, so an interrupted download continues where it stopped. Members of the archive are extracted as soon as their
+# bytes are complete, i.e., while later ranges are still downloading.
+block_size = 1 << 20
+retries = 3
 
-def main():
-    location = "https://my.hidrive.com/api/sharelink/download?id=Q942Lh8Hz"
-    file_name = "experiment_data.zip"
-    data_dir = "resources/experiment_data"
 
-    print("- Retrieving the dataset.")
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument("--url", type=str, default="https://my.hidrive.com/api/sharelink/download?id=Q942Lh8Hz")
+    parser.add_argument("--file_name", type=str, default="experiment_data.zip")
+    parser.add_argument("--data_dir", type=str, default="resources/experiment_data")
+    parser.add_argument("--connections", "-c", type=int, default=8, help="Number of parallel range requests")
+    parser.add_argument("--range_size", type=int, default=64, help="Size of a range in MiB")
+    parser.add_argument("--sha256", type=str, default=None, help="Expected SHA-256 checksum of the archive")
+    parser.add_argument("--keep_archive", action="store_true")
+    return parser.parse_args()
+
+
+def resolve(location):
+    # Returns the final URL (after redirects), the file size, and whether the server supports range requests.
+    request = urllib.request.Request(location, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(request) as response:
+        meta = response.info()
+        if response.status == 206 and "Content-Range" in meta:
+            return response.geturl(), int(meta["Content-Range"].split("/")[-1]), True
+        if "X-Dropbox-Content-Length" in meta:
+            return response.geturl(), int(meta["X-Dropbox-Content-Length"]), False
+        if "Content-Length" in meta:
+            return response.geturl(), int(meta["Content-Length"]), False
+    return response.geturl(), None, False
+
+
+class Journal:
+    def __init__(self, file_path, url, file_size, range_size):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.state = {"url": url, "file_size": file_size, "range_size": range_size, "ranges": [], "extracted": []}
+        if os.path.isfile(file_path):
+            with open(file_path) as f:
+                state = json.load(f)
+            # Only resume downloads of the same file with the same ranges.
+            if all(state[key] == self.state[key] for key in ["url", "file_size", "range_size"]):
+                self.state = state
+
+    def is_resumed(self):
+        return len(self.state["ranges"]) > 0
+
+    def reset(self):
+        self.state["ranges"] = []
+        self.state["extracted"] = []
+
+    def finished_ranges(self):
+        return set(self.state["ranges"])
+
+    def extracted_members(self):
+        return set(self.state["extracted"])
+
+    def add(self, key, value):
+        with self.lock:
+            self.state[key].append(value)
+            # Replace the journal atomically so that it is never broken, even if we are killed while writing it.
+            with open(self.file_path + ".tmp", "w") as f:
+                json.dump(self.state, f)
+            os.replace(self.file_path + ".tmp", self.file_path)
+
+
+class Progress:
+    def __init__(self, file_size, retrieved):
+        self.file_size = file_size
+        self.retrieved = retrieved
+        self.lock = threading.Lock()
+
+    def add(self, size):
+        with self.lock:
+            self.retrieved += size
+            print(r"- Retrieved %3.2f%% of the data." % (self.retrieved * 100.0 / self.file_size), end="\r")
+
+
+def download_range(url, file_descriptor, begin, end, progress):
+    # Downloads the bytes [begin, end) into the preallocated file. Failed attempts are repeated from the start.
+    for attempt in range(retries):
+        retrieved = 0
+        try:
+            request = urllib.request.Request(url, headers={"Range": f"bytes={begin}-{end - 1}"})
+            with urllib.request.urlopen(request) as response:
+                assert response.status == 206, f"Server ignored range request (status {response.status})"
+                offset = begin
+                while offset < end:
+                    buffer = response.read(min(block_size, end - offset))
+                    if not buffer:
+                        raise IOError(f"Connection closed after {offset - begin} of {end - begin} bytes")
+                    os.pwrite(file_descriptor, buffer, offset)
+                    offset += len(buffer)
+                    retrieved += len(buffer)
+                    progress.add(len(buffer))
+            return
+        except Exception as e:
+            if retrieved:
+                progress.add(-retrieved)
+            if attempt == retries - 1:
+                raise e
+
+
+def download_stream(url, file_name, file_size):
+    # Fallback for servers that do not support range requests.
+    progress = Progress(file_size, 0)
+    with urllib.request.urlopen(url) as response, open(file_name, "wb") as f:
+        while buffer := response.read(block_size):
+            f.write(buffer)
+            progress.add(len(buffer))
+
+
+def member_spans(archive):
+    # Byte ranges of the members in the archive. A member ends where the next one (or the central directory) starts.
+    members = sorted(archive.infolist(), key=lambda member: member.header_offset)
+    ends = [member.header_offset for member in members[1:]] + [archive.start_dir]
+    return [(member.filename, member.header_offset, end) for member, end in zip(members, ends)]
+
+
+def sha256_checksum(file_name):
+    file_hash = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        while block := f.read(block_size * 16):
+            file_hash.update(block)
+    return file_hash.hexdigest()
 
-    if not os.path.isdir(data_dir):
-        os.makedirs(data_dir)
 
-    url = urllib.request.urlopen(location)
+def extract_member(file_name, member, data_dir):
+    # Every extraction uses its own handle, so members can be extracted in parallel. zipfile checks the CRC.
+    with zipfile.ZipFile(file_name, "r") as archive:
+        archive.extract(member, data_dir)
+    return member
 
-    meta = url.info()
 
-    if "X-Dropbox-Content-Length" in meta:
-        file_size = int(meta["X-Dropbox-Content-Length"])
-    elif "Content-Length" in meta:
-        file_size = int(meta["Content-Length"])
+def download_and_extract(url, file_name, file_size, data_dir, connections, range_size):
+    journal = Journal(file_name + ".journal", url, file_size, range_size)
+    if journal.is_resumed() and os.path.isfile(file_name) and os.path.getsize(file_name) == file_size:
+        print(f"- Resuming download ({len(journal.finished_ranges())} ranges finished before).")
     else:
-        print("- Aborting. Could not retrieve the dataset's file size.")
+        journal.reset()
+        with open(file_name, "wb") as f:
+            f.truncate(file_size)
 
-    file = open(file_name, "wb")
+    range_count = (file_size + range_size - 1) // range_size
+    finished_ranges = journal.finished_ranges()
+    extracted_members = journal.extracted_members()
+    progress = Progress(file_size, sum(min(range_size, file_size - index * range_size) for index in finished_ranges))
 
-    print(f"- Downloading: {file_name} ({round(file_size / 1000**3, 2)} GB / {round(file_size / 1024**3, 2)} GiB)")
+    # The central directory is at the end of the archive, so we download the last range first. Then we know the members
+    # and can extract them once the ranges that contain them are complete.
+    pending_ranges = [index for index in range(range_count) if index not in finished_ranges]
+    if range_count - 1 in pending_ranges:
+        pending_ranges.remove(range_count - 1)
+        pending_ranges.insert(0, range_count - 1)
 
-    already_retrieved = 0
-    block_size = 8192
-    try:
-        while True:
-            buffer = url.read(block_size)
-            if not buffer:
-                break
-
-            already_retrieved += len(buffer)
-            file.write(buffer)
-            status = r"- Retrieved %3.2f%% of the data." % (already_retrieved * 100.0 / file_size)
-            status = status + chr(8) * (len(status) + 1)
-            print(status, end="\r")
-    except Exception:
-        print("- Aborting. Something went wrong during the download.")
-        os.remove(file_name)
+    spans = None
+    lock = threading.Lock()
+    extractions = []
+    file_descriptor = os.open(file_name, os.O_WRONLY)
+
+    with ThreadPoolExecutor(max_workers=connections) as extraction_pool:
+
+        def extract_complete_members():
+            nonlocal spans
+            with lock:
+                if spans is None:
+                    try:
+                        with zipfile.ZipFile(file_name, "r") as archive:
+                            spans = member_spans(archive)
+                    except zipfile.BadZipFile:
+                        # The central directory is not complete yet.
+                        return
+                for member, begin, end in spans:
+                    if member in extracted_members:
+                        continue
+                    if all(
+                        index in finished_ranges for index in range(begin // range_size, (end - 1) // range_size + 1)
+                    ):
+                        extracted_members.add(member)
+                        extraction = extraction_pool.submit(extract_member, file_name, member, data_dir)
+                        extraction.add_done_callback(record_extraction)
+                        extractions.append(extraction)
+
+        def record_extraction(extraction):
+            if extraction.exception() is None:
+                journal.add("extracted", extraction.result())
+
+        def download(index):
+            begin = index * range_size
+            download_range(url, file_descriptor, begin, min(begin + range_size, file_size), progress)
+            with lock:
+                finished_ranges.add(index)
+            journal.add("ranges", index)
+            extract_complete_members()
+
+        try:
+            extract_complete_members()
+            with ThreadPoolExecutor(max_workers=connections) as download_pool:
+                for future in [download_pool.submit(download, index) for index in pending_ranges]:
+                    future.result()
+        finally:
+            os.close(file_descriptor)
+
+        # If all ranges were downloaded before, the members that were not extracted yet are extracted now.
+        extract_complete_members()
+        print()
+        print(f"- Waiting for the extraction of {len(extractions)} files ...")
+        for extraction in extractions:
+            extraction.result()
+
+
+def main(location, file_name, data_dir, connections, range_size, expected_checksum, keep_archive):
+    print("- Retrieving the dataset.")
+
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    url, file_size, supports_ranges = resolve(location)
+    if file_size is None:
+        print("- Aborting. Could not retrieve the dataset's file size.")
         sys.exit(1)
 
-    file.close()
+    print(f"- Downloading: {file_name} ({round(file_size / 1000**3, 2)} GB / {round(file_size / 1024**3, 2)} GiB)")
 
-    print()
-    print("- Unzipping the file...")
+    def remove_archive():
+        for path in [file_name, file_name + ".journal"]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def remove_extracted_members():
+        # Members are extracted while downloading, i.e., before we can verify the archive. The journal lists them.
+        journal_path = file_name + ".journal"
+        if not os.path.isfile(journal_path):
+            return
+        with open(journal_path) as f:
+            extracted_members = json.load(f)["extracted"]
+        for member in extracted_members:
+            member_path = os.path.join(data_dir, member)
+            if os.path.isfile(member_path):
+                os.remove(member_path)
+        print(f"- Removed {len(extracted_members)} unverified files from {data_dir}.")
 
     try:
-        zip = zipfile.ZipFile(file_name, "r")
-        zip.extractall(data_dir)
-        zip.close()
-    except Exception:
-        print("- Aborting. Something went wrong during unzipping.")
-        os.remove(file_name)
+        if supports_ranges:
+            download_and_extract(url, file_name, file_size, data_dir, connections, range_size * 1024**2)
+        else:
+            print("- The server does not support range requests, downloading without resume.")
+            download_stream(url, file_name, file_size)
+            print()
+    except zipfile.BadZipFile:
+        # The downloaded data is broken (e.g., wrong CRC of a member), so resuming would not help.
+        print("\n- Aborting. Something went wrong during unzipping.")
+        remove_archive()
         sys.exit(3)
+    except Exception as e:
+        # The journal is kept, so the next run resumes the download.
+        print(f"\n- Aborting. Something went wrong during the download: {e}")
+        sys.exit(1)
+
+    if expected_checksum:
+        checksum = sha256_checksum(file_name)
+        if checksum != expected_checksum.lower():
+            print(f"- Aborting. Checksum mismatch: expected {expected_checksum}, got {checksum}.")
+            remove_extracted_members()
+            remove_archive()
+            sys.exit(2)
+        print("- Checksum verified.")
 
-    os.remove(file_name)
+    if not supports_ranges:
+        print("- Unzipping the file...")
+        try:
+            with zipfile.ZipFile(file_name, "r") as archive:
+                archive.extractall(data_dir)
+        except Exception:
+            print("- Aborting. Something went wrong during unzipping.")
+            remove_archive()
+            sys.exit(3)
+
+    if keep_archive:
+        # Only ranged downloads have a journal.
+        if os.path.isfile(file_name + ".journal"):
+            os.remove(file_name + ".journal")
+    else:
+        remove_archive()
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(args.url, args.file_name, args.data_dir, args.connections, args.range_size, args.sha256, args.keep_archive)
@@ -1,96 +1,141 @@
 #!/usr/bin/python3
 
+import argparse as ap
 import csv
+import hashlib
+import io
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
-import pandas as pd
-
-
-def parse_data_type(type_string):
-    if type_string == "int":
-        return "Int32"
-    elif type_string == "long":
-        return "Int64"
-    elif type_string == "float":
-        return "Float32"
-    elif type_string == "double":
-        return "Float64"
-    elif type_string == "string":
-        return "string"
-    raise AttributeError(f"Unknown data type: '{type_string}'")
-
-
-def parse_csv_meta(meta):
-    column_names = list()
-    column_data_types = dict()
-    nullable = dict()
-    for column_meta in meta["columns"]:
-        column_name = column_meta["name"]
-        column_names.append(column_name)
-        column_data_types[column_name] = parse_data_type(column_meta["type"])
-        nullable[column_name] = column_meta["nullable"]
-    return column_names, column_data_types, nullable
-
-
-def main():
-    tables = [
-        "aka_name",
-        "aka_title",
-        "cast_info",
-        "char_name",
-        "comp_cast_type",
-        "company_name",
-        "company_type",
-        "complete_cast",
-        "info_type",
-        "keyword",
-        "kind_type",
-        "link_type",
-        "movie_companies",
-        "movie_info",
-        "movie_info_idx",
-        "movie_keyword",
-        "movie_link",
-        "name",
-        "person_info",
-        "role_type",
-        "title",
-    ]
-    tables = ["char_name"]
-    tables = ["title", "char_name", "person_info", "movie_info"]
-
-    data_path = "."
-
-    for i, table_name in enumerate(tables):
-        print(f"{i+1}/{len(tables)}", table_name)
-        new_file_path = f"{data_path}/{table_name}.hana.csv"
-        table_file_path = f"{data_path}/{table_name}.csv"
-        with open(table_file_path + ".json") as f:
-            meta = json.load(f)
-
-        column_names, column_types, nullable = parse_csv_meta(meta)
-        data = pd.read_csv(table_file_path, header=None, names=column_names, dtype=column_types, keep_default_na=False)
-        data.to_csv(
-            new_file_path,
-            sep="\u0007",
-            header=False,
-            index=False,
-            escapechar="+",
+# HANA has issues with some JOB tables, so we rewrite the CSVs with a delimiter that does not occur in any file. The
+# HANA documentation suggests to use '\u0007'. Quotes are escaped with '+'. Fields that read 'Null' are quoted so that
+# HANA does not confuse them with NULL.
+separator = "\u0007"
+escape_character = "+"
+chunk_size = 100_000
+hash_block_size = 1 << 24
+
+csv.field_size_limit(sys.maxsize)
+
+
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument(
+        "tables",
+        type=str,
+        nargs="*",
+        default=["title", "char_name", "person_info", "movie_info"],
+        help="Tables to transcode, i.e., <table>.csv becomes <table>.hana.csv",
+    )
+    parser.add_argument("--data_path", "-d", type=str, default=".")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+
+def content_hash(file_path):
+    file_hash = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        while block := f.read(hash_block_size):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def transcode_table(table_file_path, new_file_path, excluded_ids=[]):
+    """Transcode the CSV file in a single streaming pass and return the number of written rows.
+
+    Rows are read with the csv module and written chunk by chunk, so memory does not grow with the table size. Rows
+    whose first column is in excluded_ids are skipped.
+    """
+    excluded_ids = {str(excluded_id) for excluded_id in excluded_ids}
+    row_count = 0
+    with open(table_file_path, newline="", encoding="utf-8") as source, open(
+        new_file_path, "w", newline="", encoding="utf-8"
+    ) as target:
+        reader = csv.reader(source)
+        buffer = io.StringIO()
+        writer = csv.writer(
+            buffer,
+            delimiter=separator,
             quoting=csv.QUOTE_NONE,
             quotechar='"',
+            escapechar=escape_character,
+            lineterminator="\n",
+        )
+
+        def flush():
+            # The replacements never span rows, so we can apply them per chunk of complete rows.
+            chunk = buffer.getvalue().replace('"', '+"')
+            target.write(chunk.replace(f"{separator}Null{separator}", f'{separator}"Null"{separator}'))
+            buffer.seek(0)
+            buffer.truncate()
+
+        chunk_row_count = 0
+        for row in reader:
+            if excluded_ids and row and row[0] in excluded_ids:
+                continue
+            writer.writerow(row)
+            chunk_row_count += 1
+            if chunk_row_count == chunk_size:
+                flush()
+                row_count += chunk_row_count
+                chunk_row_count = 0
+        flush()
+        row_count += chunk_row_count
+    return row_count
+
+
+def transcode_cached(data_path, table_name, excluded_ids=[]):
+    # The result is cached by a hash of the source file's content (and the excluded rows). Returns whether the table
+    # had to be transcoded.
+    table_file_path = f"{data_path}/{table_name}.csv"
+    new_file_path = f"{data_path}/{table_name}.hana.csv"
+    stamp_file_path = f"{data_path}/{table_name}.hana.json"
+    stamp = {"source_hash": content_hash(table_file_path), "excluded_ids": sorted(excluded_ids)}
+
+    if os.path.isfile(new_file_path) and os.path.isfile(stamp_file_path):
+        with open(stamp_file_path) as f:
+            if json.load(f) == stamp:
+                return table_name, False
+
+    # The temporary files are per process since runners on other NUMA nodes might transcode the same table
+    # concurrently. The stamp is written last, so it only exists for complete files.
+    temporary_file_path = f"{new_file_path}.{os.getpid()}.tmp"
+    transcode_table(table_file_path, temporary_file_path, excluded_ids)
+    os.replace(temporary_file_path, new_file_path)
+    temporary_stamp_file_path = f"{stamp_file_path}.{os.getpid()}.tmp"
+    with open(temporary_stamp_file_path, "w") as f:
+        json.dump(stamp, f)
+    os.replace(temporary_stamp_file_path, stamp_file_path)
+    return table_name, True
+
+
+def transcode_tables(data_path, table_names, excluded_ids={}, workers=1):
+    """Transcode the tables in parallel. excluded_ids maps table names to ids of rows to skip.
+
+    Returns the names of the tables that had to be transcoded, i.e., whose cached HANA CSV was missing or outdated.
+    """
+    transcoded_tables = list()
+    with ProcessPoolExecutor(max_workers=max(min(workers, len(table_names)), 1)) as pool:
+        results = pool.map(
+            transcode_cached,
+            [data_path] * len(table_names),
+            table_names,
+            [excluded_ids.get(table_name, []) for table_name in table_names],
         )
+        for table_name, transcoded in results:
+            if transcoded:
+                transcoded_tables.append(table_name)
+    return transcoded_tables
 
-        data = None
-        with open(new_file_path) as f:
-            data = f.read()
-        data = data.replace('"', '+"').replace("\u0007Null\u0007", '\u0007"Null"\u0007')
-        with open(new_file_path, "w") as f:
-            f.write(data)
 
-        # with open(new_file_path) as f:
-        #     data = f.read()
-        #     print("   ", data.count('"'), data.count("+"))
+def main(data_path, tables, workers):
+    transcoded_tables = transcode_tables(data_path, tables, workers=workers)
+    for table_name in tables:
+        print(table_name, "transcoded" if table_name in transcoded_tables else "up to date")
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(args.data_path, args.tables, args.workers)
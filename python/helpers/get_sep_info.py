@@ -1,42 +1,145 @@
 #!/usr/bin/python3
 
+import argparse as ap
+import mmap
 import os
 import string
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 
-def main():
-    seps = string.printable + string.whitespace
-    unmachted_sep = {sep: False for sep in seps}
-
-    for table_file in sorted([f for f in os.listdir(".") if f.endswith(".hana.csv")]):
-        table_name = table_file[: -len(".hana.csv")]
-        print(table_name, table_file)
-        # unmachted_sep = {sep: False for sep in seps}
-        with open(table_file) as f:
-            for line in f:
-                if "+" in line or '"' in line:
-                    print(line)
-                    break
-                found_seps = list()
-                for sep, found in unmachted_sep.items():
-                    if found:
-                        continue
-                    if sep in line:
-                        found_seps.append(sep)
-                for sep in found_seps:
-                    del unmachted_sep[sep]
-                    if len(unmachted_sep) == 0:
-                        break
-
-        # if ("|") in unmachted_sep:
-        #     print("|", seps.index("|"))
-        #     continue
-
-    # print(len(unmachted_sep))
-
-    # for sep in unmachted_sep:
-    #     print(sep, seps.index(sep), sep.encode())
+# Counts how often each byte and each non-ASCII UTF-8 code point occurs in the table files. Characters that never occur
+# in a table can be used as separator, quote, or escape character without any escaping when transcoding it. Each file
+# is read once, memory-mapped and in chunks, and the counting happens vectorized in NumPy.
+chunk_size = 1 << 26
+# Candidates in order of preference. HANA suggests '\u0007' as separator, see helpers/encode.py.
+separator_candidates = list(
+    dict.fromkeys([",", "|", "\t", ";", "\u0007", "\u0001", "\u001f", "\u001e", *string.punctuation])
+)
+quote_candidates = ['"', "'", "`", "\u0002"]
+escape_candidates = ["\\", "+", "^", "~", "\u0003"]
+# Files derived from the raw tables (see helpers/encode.py and helpers/order_by_id.py). They would count the tables
+# twice, so we only analyze them if --suffix asks for them.
+derived_suffixes = [".hana.csv", ".sorted.csv"]
+
+
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument("files", type=str, nargs="*", help="Files to analyze, defaults to all CSV files in --data_path")
+    parser.add_argument("--data_path", "-d", type=str, default=".")
+    parser.add_argument(
+        "--suffix",
+        type=str,
+        default=".csv",
+        help="Suffix of the files to analyze in --data_path. Derived files (e.g., .hana.csv) need their full suffix",
+    )
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+
+def count_code_points(data):
+    # Decodes the multi-byte UTF-8 sequences of the chunk and counts their code points. Lead bytes of two-, three-, and
+    # four-byte sequences start with 110, 1110, and 11110, continuation bytes with 10.
+    code_points = []
+    for length, lead_mask, lead_value in [(2, 0xE0, 0xC0), (3, 0xF0, 0xE0), (4, 0xF8, 0xF0)]:
+        positions = np.flatnonzero((data[: len(data) - length + 1] & lead_mask) == lead_value)
+        if len(positions) == 0:
+            continue
+        value = (data[positions] & (0xFF >> (length + 1))).astype(np.int64)
+        for offset in range(1, length):
+            value = (value << 6) | (data[positions + offset] & 0x3F)
+        code_points.append(value)
+    if not code_points:
+        return Counter()
+    values, counts = np.unique(np.concatenate(code_points), return_counts=True)
+    return Counter(dict(zip(values.tolist(), counts.tolist())))
+
+
+def histogram(file_path):
+    byte_counts = np.zeros(256, dtype=np.int64)
+    code_point_counts = Counter()
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return file_path, byte_counts, code_point_counts
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            data = np.frombuffer(mapped_file, dtype=np.uint8)
+            begin = 0
+            while begin < len(data):
+                end = min(begin + chunk_size, len(data))
+                # Do not split multi-byte characters: move the end back to the start of a character.
+                while end < len(data) and (data[end] & 0xC0) == 0x80:
+                    end -= 1
+                chunk = data[begin:end]
+                chunk_byte_counts = np.bincount(chunk, minlength=256)
+                byte_counts += chunk_byte_counts
+                if chunk_byte_counts[0x80:].any():
+                    code_point_counts += count_code_points(chunk)
+                begin = end
+            # The arrays must not reference the mapped file anymore when it is closed.
+            del data, chunk
+    return file_path, byte_counts, code_point_counts
+
+
+def occurrences(character, byte_counts, code_point_counts):
+    code_point = ord(character)
+    return int(byte_counts[code_point]) if code_point < 0x80 else code_point_counts[code_point]
+
+
+def safe_characters(candidates, byte_counts, code_point_counts):
+    return [character for character in candidates if occurrences(character, byte_counts, code_point_counts) == 0]
+
+
+def describe(characters):
+    return " ".join(repr(character) for character in characters) if characters else "none"
+
+
+def report(name, byte_counts, code_point_counts):
+    print(name)
+    frequent = ", ".join(
+        f"{repr(character)}: {occurrences(character, byte_counts, code_point_counts)}"
+        for character in [",", "|", "\t", '"', "\\", "+", "\r"]
+    )
+    print(f"  occurrences         {frequent}")
+    print(f"  non-ASCII chars     {len(code_point_counts)} distinct, {sum(code_point_counts.values())} total")
+    print(f"  safe separators     {describe(safe_characters(separator_candidates, byte_counts, code_point_counts))}")
+    print(f"  safe quotes         {describe(safe_characters(quote_candidates, byte_counts, code_point_counts))}")
+    print(f"  safe escapes        {describe(safe_characters(escape_candidates, byte_counts, code_point_counts))}")
+
+
+def data_files(data_path, suffix):
+    excluded_suffixes = [derived_suffix for derived_suffix in derived_suffixes if not suffix.endswith(derived_suffix)]
+    return sorted(
+        os.path.join(data_path, file_name)
+        for file_name in os.listdir(data_path)
+        if file_name.endswith(suffix) and not any(file_name.endswith(excluded) for excluded in excluded_suffixes)
+    )
+
+
+def main(files, workers):
+    total_byte_counts = np.zeros(256, dtype=np.int64)
+    total_code_point_counts = Counter()
+    with ProcessPoolExecutor(max_workers=max(min(workers, len(files)), 1)) as pool:
+        for file_path, byte_counts, code_point_counts in pool.map(histogram, files):
+            report(os.path.basename(file_path), byte_counts, code_point_counts)
+            total_byte_counts += byte_counts
+            total_code_point_counts += code_point_counts
+
+    report(f"All {len(files)} files", total_byte_counts, total_code_point_counts)
+    # Suggest settings that work for all tables. Separator, quote, and escape character have to differ.
+    separators = safe_characters(separator_candidates, total_byte_counts, total_code_point_counts)
+    quotes = safe_characters(quote_candidates, total_byte_counts, total_code_point_counts)
+    escapes = safe_characters(escape_candidates, total_byte_counts, total_code_point_counts)
+    suggestion = []
+    for kind, characters in [("separator", separators), ("quote", quotes), ("escape", escapes)]:
+        characters = [character for character in characters if character not in suggestion]
+        suggestion.append(characters[0] if characters else None)
+        print(f"Suggested {kind}: {repr(suggestion[-1]) if characters else 'none (requires escaping)'}")
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    files = args.files
+    if not files:
+        files = data_files(args.data_path, args.suffix)
+    main(files, args.workers)
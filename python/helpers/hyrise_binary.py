@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+import argparse as ap
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from helpers import column_cache
+from helpers.csv_meta import load_csv_meta
+from helpers.encode import content_hash
+
+# Hyrise's binary table format (see hyrise/src/lib/import_export/binary/binary_writer.hpp), which we write without
+# encoding, i.e., as value segments. All values are little-endian. Increase the version whenever the format of the
+# Hyrise submodule changes, which invalidates all cached files.
+format_version = 1
+chunk_size = 65535
+hyrise_types = {"Int32": "int", "Int64": "long", "Float32": "float", "Float64": "double", "string": "string"}
+unencoded = 0
+
+
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument("tables", type=str, nargs="*", help="Tables to convert, defaults to all CSV files")
+    parser.add_argument("--data_path", "-d", type=str, default="resources/experiment_data")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+
+def binary_file_path(data_path, table_name):
+    return f"{data_path}/{table_name}.bin"
+
+
+def write_strings(f, strings):
+    # Strings are written as an array of their lengths (size_t), followed by their concatenated characters.
+    f.write(np.array([len(string) for string in strings], dtype="<u8").tobytes())
+    f.write(b"".join(strings))
+
+
+def write_header(f, column_names, column_types, nullable, chunk_count):
+    f.write(np.array(chunk_size, dtype="<u4").tobytes())
+    f.write(np.array(chunk_count, dtype="<u4").tobytes())
+    f.write(np.array(len(column_names), dtype="<u2").tobytes())
+    write_strings(f, [hyrise_types[column_types[column_name]].encode() for column_name in column_names])
+    f.write(bytes(nullable[column_name] for column_name in column_names))
+    write_strings(f, [column_name.encode() for column_name in column_names])
+
+
+def write_segment(f, column, nullable, begin, end):
+    f.write(np.array(unencoded, dtype="u1").tobytes())
+    if column.data_type == "string":
+        # The offsets of the segment's strings include the end of the last one.
+        offsets_end = end + 1
+        offsets = np.asarray(column.offsets[begin:offsets_end])
+        lengths = np.diff(offsets)
+        if nullable:
+            # Like Hyrise's CSV import, we treat empty fields of nullable columns as NULL.
+            f.write((column.nulls()[begin:end] | (lengths == 0)).astype("u1").tobytes())
+        f.write(lengths.astype("<u8").tobytes())
+        heap_begin, heap_end = offsets[0], offsets[-1]
+        f.write(column.values[heap_begin:heap_end].tobytes())
+        return
+
+    if nullable:
+        f.write(column.nulls()[begin:end].astype("u1").tobytes())
+    f.write(column.values[begin:end].tobytes())
+
+
+def write_table(data_path, table_name):
+    column_names, column_types, nullable = load_csv_meta(f"{data_path}/{table_name}.csv")
+    # The typed columns are read from the column cache, so we do not parse the CSV file again if it is cached.
+    columns = column_cache.load_table(data_path, table_name)
+    row_count = columns[0].row_count if columns else 0
+    chunk_count = math.ceil(row_count / chunk_size)
+
+    file_path = binary_file_path(data_path, table_name)
+    # Runners on other NUMA nodes might convert the same table concurrently, so the temporary file is per process.
+    temporary_file_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temporary_file_path, "wb") as f:
+        write_header(f, column_names, column_types, nullable, chunk_count)
+        for chunk_id in range(chunk_count):
+            begin = chunk_id * chunk_size
+            end = min(begin + chunk_size, row_count)
+            f.write(np.array(end - begin, dtype="<u4").tobytes())
+            # We do not know whether the chunk is sorted by any column.
+            f.write(np.array(0, dtype="<u4").tobytes())
+            for column in columns:
+                write_segment(f, column, nullable[column.name], begin, end)
+    os.replace(temporary_file_path, file_path)
+
+
+def write_stamp(stamp_file_path, stamp):
+    temporary_file_path = f"{stamp_file_path}.{os.getpid()}.tmp"
+    with open(temporary_file_path, "w") as f:
+        json.dump(stamp, f)
+    os.replace(temporary_file_path, stamp_file_path)
+
+
+def build_table(data_path, table_name):
+    # The binary file is cached by a hash of the source file's content and the format version. Hashing reads the whole
+    # file, so we only do it if the file's size or modification time changed. Returns whether the table had to be
+    # converted.
+    table_file_path = column_cache.table_source_path(data_path, table_name)
+    stamp_file_path = f"{data_path}/{table_name}.bin.json"
+    stat = os.stat(table_file_path)
+    stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "format_version": format_version}
+
+    cached_stamp = None
+    if os.path.isfile(binary_file_path(data_path, table_name)) and os.path.isfile(stamp_file_path):
+        with open(stamp_file_path) as f:
+            cached_stamp = json.load(f)
+        if all(cached_stamp.get(key) == value for key, value in stamp.items()):
+            return table_name, False
+
+    stamp["source_hash"] = content_hash(table_file_path)
+    if cached_stamp is not None and all(
+        cached_stamp.get(key) == stamp[key] for key in ["source_hash", "format_version"]
+    ):
+        # Only the file's metadata changed (e.g., it was copied or touched).
+        write_stamp(stamp_file_path, stamp)
+        return table_name, False
+
+    write_table(data_path, table_name)
+    write_stamp(stamp_file_path, stamp)
+    return table_name, True
+
+
+def build_tables(data_path, table_names, workers):
+    """Convert the tables' CSV files into Hyrise's binary format in parallel.
+
+    Returns the names of the tables that had to be converted, i.e., whose binary file was missing or outdated.
+    """
+    built_tables = list()
+    with ProcessPoolExecutor(max_workers=max(min(workers, len(table_names)), 1)) as pool:
+        for table_name, built in pool.map(build_table, [data_path] * len(table_names), table_names):
+            if built:
+                built_tables.append(table_name)
+    return built_tables
+
+
+def main(data_path, tables, workers):
+    if not tables:
+        tables = column_cache.list_tables(data_path)
+    built_tables = build_tables(data_path, tables, workers)
+    for table_name in tables:
+        print(table_name, "converted" if table_name in built_tables else "up to date")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.data_path, args.tables, args.workers)
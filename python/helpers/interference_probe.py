@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+import argparse as ap
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Measures the memory bandwidth that the CPUs we are bound to achieve. Run it bound to each NUMA node alone and to all
+# nodes at the same time: if the bandwidth drops when the nodes are busy, experiments on different nodes interfere
+# (e.g., via remote memory accesses or a shared memory controller) and should not run concurrently.
+
+
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument("--workers", "-w", type=int, default=len(os.sched_getaffinity(0)))
+    parser.add_argument("--size", type=int, default=256, help="Size of the copied array per worker in MiB")
+    parser.add_argument("--time", "-t", type=float, default=10, help="Duration of the measurement in seconds")
+    return parser.parse_args()
+
+
+def copy_bandwidth(size, duration):
+    # Returns the copied bytes per second (read and write) of repeated copies of an array that exceeds the caches.
+    source = np.ones(size * 1024**2 // 8, dtype=np.float64)
+    target = np.empty_like(source)
+    np.copyto(target, source)
+    copies = 0
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < duration:
+        np.copyto(target, source)
+        copies += 1
+    return 2 * source.nbytes * copies / (time.perf_counter() - start_time)
+
+
+def main(workers, size, duration):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        bandwidth = sum(pool.map(copy_bandwidth, [size] * workers, [duration] * workers))
+    print(json.dumps({"workers": workers, "bandwidth": bandwidth}))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.workers, args.size, args.time)
@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+
+import math
+import random
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Latencies are recorded in microseconds. Values below 2^significant_bits are counted exactly, larger values fall into
+    buckets whose width is 2^-(significant_bits - 1) of their magnitude (1.6 % for the default of 7 bits). The memory
+    footprint is fixed (ca. 20 KB, of which only the touched pages are materialized) and histograms with the same
+    configuration can be merged by adding their counts.
+    """
+
+    def __init__(self, significant_bits=7, max_value_bits=40):
+        self.significant_bits = significant_bits
+        self.max_value_bits = max_value_bits
+        self.sub_bucket_count = 1 << significant_bits
+        self.half_sub_bucket_count = self.sub_bucket_count >> 1
+        bucket_count = self.sub_bucket_count + (max_value_bits - significant_bits) * self.half_sub_bucket_count
+        self.counts = np.zeros(bucket_count, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.sum_of_squares = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __getstate__(self):
+        # Histograms of client processes are pickled to the parent. Most buckets are empty, so we only send the others.
+        state = self.__dict__.copy()
+        indexes = np.flatnonzero(self.counts)
+        state["counts"] = (len(self.counts), indexes, self.counts[indexes])
+        return state
+
+    def __setstate__(self, state):
+        bucket_count, indexes, counts = state["counts"]
+        state["counts"] = np.zeros(bucket_count, dtype=np.int64)
+        state["counts"][indexes] = counts
+        self.__dict__.update(state)
+
+    def _index(self, value_us):
+        if value_us < self.sub_bucket_count:
+            return value_us
+        shift = value_us.bit_length() - self.significant_bits
+        sub_bucket = value_us >> shift
+        offset = self.sub_bucket_count + (shift - 1) * self.half_sub_bucket_count
+        return offset + sub_bucket - self.half_sub_bucket_count
+
+    def _bucket_bounds(self, index):
+        if index < self.sub_bucket_count:
+            return index, index + 1
+        shift = (index - self.sub_bucket_count) // self.half_sub_bucket_count + 1
+        sub_bucket = (index - self.sub_bucket_count) % self.half_sub_bucket_count + self.half_sub_bucket_count
+        return sub_bucket << shift, (sub_bucket + 1) << shift
+
+    def bucket_width(self, value_ms):
+        # Width (in ms) of the bucket that the value falls into, i.e., the resolution of the histogram at this value.
+        value_us = min(max(int(value_ms * 1000), 0), (1 << self.max_value_bits) - 1)
+        lower, upper = self._bucket_bounds(self._index(value_us))
+        return (upper - lower) / 1000
+
+    def record(self, value_ms):
+        value_us = min(max(int(value_ms * 1000), 0), (1 << self.max_value_bits) - 1)
+        self.counts[self._index(value_us)] += 1
+        self.count += 1
+        self.sum += value_ms
+        self.sum_of_squares += value_ms * value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def merge(self, other):
+        assert (self.significant_bits, self.max_value_bits) == (
+            other.significant_bits,
+            other.max_value_bits,
+        ), "Can only merge histograms with the same configuration"
+        self.counts += other.counts
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_of_squares += other.sum_of_squares
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.sum / self.count if self.count > 0 else 0
+
+    def stdev(self):
+        if self.count < 2:
+            return 0
+        variance = (self.sum_of_squares - self.sum * self.sum / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0))
+
+    def percentile(self, percentile):
+        if self.count == 0:
+            return 0
+        rank = max(math.ceil(percentile / 100 * self.count), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        lower, upper = self._bucket_bounds(index)
+        # Report the bucket's center, but never exceed the observed extremes (e.g., for the 100th percentile).
+        return min(max((lower + upper) / 2 / 1000, self.min), self.max)
+
+    def relative_confidence_interval(self, statistic="median", z=1.96):
+        """Width of the (by default 95 %) confidence interval of the median or mean relative to the estimate itself.
+
+        The median's interval is distribution-free (order statistics at n / 2 -+ z * sqrt(n) / 2), so it cannot become
+        narrower than the histogram's resolution. Returns infinity if there are too few samples for an estimate.
+        """
+        if self.count < 5:
+            return math.inf
+
+        if statistic == "mean":
+            estimate = self.mean()
+            width = 2 * z * self.stdev() / math.sqrt(self.count)
+        elif statistic == "median":
+            estimate = self.percentile(50)
+            offset = z * math.sqrt(self.count) / 2
+            lower_rank = max(math.floor(self.count / 2 - offset), 1)
+            upper_rank = min(math.ceil(self.count / 2 + offset) + 1, self.count)
+            width = self.percentile(100 * upper_rank / self.count) - self.percentile(100 * lower_rank / self.count)
+            # Both ranks can fall into the same bucket, but we do not know the median more precisely than the bucket.
+            width = max(width, self.bucket_width(estimate))
+        else:
+            raise AttributeError(f"Unknown statistic: '{statistic}'")
+
+        return width / estimate if estimate > 0 else math.inf
+
+
+class LatencyRecorder:
+    """Records latencies into a LatencyHistogram and keeps (a subset of) the raw samples.
+
+    raw_samples is one of "all" (keep every sample), "reservoir" (keep a uniform random sample of at most reservoir_size
+    samples), or "none". The recorder behaves like the list of runtimes it replaces, i.e., append() and len() work as
+    before. Samples can be arbitrary rows as long as the latency is passed separately.
+    """
+
+    def __init__(self, raw_samples="all", reservoir_size=10000, seed=None):
+        assert raw_samples in ["all", "reservoir", "none"], f"Unknown raw sample mode: '{raw_samples}'"
+        self.raw_samples = raw_samples
+        self.reservoir_size = reservoir_size
+        self.histogram = LatencyHistogram()
+        self.samples = []
+        self.random = random.Random(seed)
+
+    def append(self, value_ms, sample=None):
+        self.histogram.record(value_ms)
+        sample = value_ms if sample is None else sample
+
+        if self.raw_samples == "all":
+            self.samples.append(sample)
+        elif self.raw_samples == "reservoir":
+            # Algorithm R: the n-th sample replaces a random element of the reservoir with probability size / n.
+            if len(self.samples) < self.reservoir_size:
+                self.samples.append(sample)
+            else:
+                position = self.random.randrange(self.histogram.count)
+                if position < self.reservoir_size:
+                    self.samples[position] = sample
+
+    def __getstate__(self):
+        # Recorders of client processes are merged into the parent's recorders, which draw with their own generator.
+        # Thus, we do not send the generator's state (ca. 2.5 KB).
+        state = self.__dict__.copy()
+        del state["random"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.random = random.Random()
+
+    def merge(self, other):
+        total_count = self.histogram.count + other.histogram.count
+        if self.raw_samples == "reservoir" and total_count > self.reservoir_size:
+            # Draw from both reservoirs proportionally to the number of samples they represent.
+            own_share = round(self.reservoir_size * self.histogram.count / total_count)
+            own_samples = self.random.sample(self.samples, min(own_share, len(self.samples)))
+            other_samples = self.random.sample(
+                other.samples, min(self.reservoir_size - len(own_samples), len(other.samples))
+            )
+            self.samples = own_samples + other_samples
+        else:
+            self.samples += other.samples
+        self.histogram.merge(other.histogram)
+        return self
+
+    def __len__(self):
+        return self.histogram.count
+
+
+def paired_speedup(baseline_runtimes, variant_runtimes, z=1.96):
+    """Median speedup of a variant over the baseline from paired runtimes with a (by default 95 %) confidence interval.
+
+    The speedup of a pair is the baseline runtime divided by the variant runtime. As for the median latency, the
+    interval is distribution-free (order statistics at n / 2 -+ z * sqrt(n) / 2). Returns (speedup, lower, upper), where
+    the bounds are 0 and infinity if there are too few pairs for an estimate.
+    """
+    speedups = np.sort(np.asarray(baseline_runtimes, dtype=np.float64) / np.asarray(variant_runtimes, dtype=np.float64))
+    count = len(speedups)
+    if count == 0:
+        return math.nan, 0.0, math.inf
+
+    median = float(np.median(speedups))
+    if count < 5:
+        return median, 0.0, math.inf
+
+    offset = z * math.sqrt(count) / 2
+    lower_rank = max(math.floor(count / 2 - offset), 1)
+    upper_rank = min(math.ceil(count / 2 + offset) + 1, count)
+    return median, float(speedups[lower_rank - 1]), float(speedups[upper_rank - 1])
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from helpers import column_cache
+from helpers.csv_meta import load_csv_meta
+
+# MonetDB represents NULL in binary integer columns by the smallest value of the type and in string columns by 0x80.
+integer_types = {"Int32": ("<i4", np.iinfo(np.int32).min), "Int64": ("<i8", np.iinfo(np.int64).min)}
+string_null = b"\x80"
+
+
+def column_file_path(data_path, table_name, column_name):
+    return f"{data_path}/{table_name}.{column_name}.bin"
+
+
+def source_stamp(table_file_path):
+    # Binary files are valid as long as the (possibly compressed) source CSV did not change (as far as size and
+    # modification time tell).
+    stat = os.stat(table_file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_cached(data_path, table_name, column_names):
+    stamp_file_path = f"{data_path}/{table_name}.monetdb.json"
+    if not os.path.isfile(stamp_file_path):
+        return False
+    with open(stamp_file_path) as f:
+        stamp = json.load(f)
+    if stamp != source_stamp(column_cache.table_source_path(data_path, table_name)):
+        return False
+    return all(os.path.isfile(column_file_path(data_path, table_name, column_name)) for column_name in column_names)
+
+
+def write_column(file_path, column):
+    # Columns are written from the memory-mapped column cache, so the CSV file is not parsed again.
+    null_mask = column.null_mask
+
+    if column.data_type == "string":
+        # Strings are stored as a heap of NUL-terminated UTF-8 values, NULLs as 0x80. We insert the terminators (and
+        # the NULL markers) at the ends of the values in the cached heap. The inserted arrays have one entry per row,
+        # so we only need memory for the output besides the (memory-mapped) heap, even for large string tables.
+        is_null = column.nulls()
+        terminator_counts = 1 + is_null.astype(np.int64)
+        positions = np.repeat(column.offsets[1:] - column.offsets[0], terminator_counts)
+        terminators = np.zeros(len(positions), dtype=np.uint8)
+        # NULLs get two bytes, the marker comes first.
+        terminators[(np.cumsum(terminator_counts) - terminator_counts)[is_null]] = string_null[0]
+        np.insert(np.asarray(column.values), positions, terminators).tofile(file_path)
+        return
+
+    assert column.data_type in integer_types, f"{column.name} has type {column.data_type}, which we cannot encode"
+    binary_type, null_value = integer_types[column.data_type]
+    values = column.values
+    if null_mask is not None:
+        values = np.where(null_mask, np.array(null_value, dtype=binary_type), values)
+    np.asarray(values, dtype=binary_type).tofile(file_path)
+
+
+def encode_table(data_path, table_name):
+    table_file_path = f"{data_path}/{table_name}.csv"
+    column_names, _, _ = load_csv_meta(table_file_path)
+    if is_cached(data_path, table_name, column_names):
+        return table_name, False
+
+    stamp = source_stamp(column_cache.table_source_path(data_path, table_name))
+    for column in column_cache.load_table(data_path, table_name):
+        binary_file_path = column_file_path(data_path, table_name, column.name)
+        # Write to a temporary file first so that interrupted runs do not leave broken files behind. The file is per
+        # process since runners on other NUMA nodes might encode the same table concurrently.
+        temporary_file_path = f"{binary_file_path}.{os.getpid()}.tmp"
+        write_column(temporary_file_path, column)
+        os.replace(temporary_file_path, binary_file_path)
+
+    stamp_file_path = f"{data_path}/{table_name}.monetdb.json"
+    with open(f"{stamp_file_path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(stamp, f)
+    os.replace(f"{stamp_file_path}.{os.getpid()}.tmp", stamp_file_path)
+    return table_name, True
+
+
+def encode_tables(data_path, table_names, workers):
+    """Encode the tables (via the column cache) into MonetDB's little-endian binary column format in parallel.
+
+    Returns the names of the tables that had to be (re-)encoded. Up-to-date binary files are not touched.
+    """
+    encoded_tables = list()
+    with ProcessPoolExecutor(max_workers=max(min(workers, len(table_names)), 1)) as pool:
+        for table_name, encoded in pool.map(encode_table, [data_path] * len(table_names), table_names):
+            if encoded:
+                encoded_tables.append(table_name)
+    return encoded_tables
+
+
+def column_files(data_path, table_name):
+    column_names, _, _ = load_csv_meta(f"{data_path}/{table_name}.csv")
+    return [column_file_path(data_path, table_name, column_name) for column_name in column_names]
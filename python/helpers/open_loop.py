@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+import asyncio
+import random
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+
+def arrival_offsets(rate, duration, arrival_process, seed=None):
+    # Offsets (in seconds, relative to the start of the measurement) at which requests are scheduled. The schedule does
+    # not depend on how fast the DBMS answers, so slow queries cannot throttle the load (no coordinated omission).
+    generator = random.Random(seed)
+    offset = 0.0
+    while True:
+        if arrival_process == "poisson":
+            offset += generator.expovariate(rate)
+        elif arrival_process == "constant":
+            offset += 1 / rate
+        else:
+            raise AttributeError(f"Unknown arrival process: '{arrival_process}'")
+        if offset >= duration:
+            return
+        yield offset
+
+
+async def wait_for_connection(connection):
+    loop = asyncio.get_running_loop()
+    file_descriptor = connection.fileno()
+    while True:
+        state = connection.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+
+        ready = loop.create_future()
+        if state == psycopg2.extensions.POLL_READ:
+            loop.add_reader(file_descriptor, ready.set_result, None)
+            try:
+                await ready
+            finally:
+                loop.remove_reader(file_descriptor)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            loop.add_writer(file_descriptor, ready.set_result, None)
+            try:
+                await ready
+            finally:
+                loop.remove_writer(file_descriptor)
+        else:
+            raise psycopg2.OperationalError(f"Unexpected poll state: {state}")
+
+
+async def open_session(connection_parameters):
+    connection = psycopg2.connect(**connection_parameters, async_=True)
+    await wait_for_connection(connection)
+    return connection
+
+
+async def execute(connection, query):
+    cursor = connection.cursor()
+    cursor.execute(query)
+    await wait_for_connection(connection)
+    if cursor.description is not None:
+        cursor.fetchall()
+    cursor.close()
+
+
+async def run_request(sessions, busy_sessions, query_name, query, scheduled_time, start_time, samples):
+    connection = await sessions.get()
+    busy_sessions.add(connection)
+    service_start = time.perf_counter()
+    try:
+        await execute(connection, query)
+    except psycopg2.extensions.QueryCanceledError:
+        # Statements canceled at the end of the measurement are dropped.
+        return
+    finally:
+        busy_sessions.discard(connection)
+        sessions.put_nowait(connection)
+    service_end = time.perf_counter()
+
+    samples.append(
+        (
+            query_name,
+            scheduled_time - start_time,
+            (service_start - scheduled_time) * 1000,
+            (service_end - service_start) * 1000,
+            (service_end - scheduled_time) * 1000,
+        )
+    )
+
+
+async def drive(
+    connection_parameters, queries, session_count, rate, arrival_process, duration, seed, cancel_at_deadline
+):
+    sessions = asyncio.Queue()
+    busy_sessions = set()
+    connections = await asyncio.gather(*[open_session(connection_parameters) for _ in range(session_count)])
+    for connection in connections:
+        sessions.put_nowait(connection)
+
+    generator = random.Random(seed)
+    query_names = list(queries.keys())
+    samples = []
+    requests = []
+    start_time = time.perf_counter()
+
+    for offset in arrival_offsets(rate, duration, arrival_process, seed):
+        delay = start_time + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        query_name = generator.choice(query_names)
+        requests.append(
+            asyncio.create_task(
+                run_request(
+                    sessions, busy_sessions, query_name, queries[query_name], start_time + offset, start_time, samples
+                )
+            )
+        )
+
+    if cancel_at_deadline and requests:
+        _, pending = await asyncio.wait(requests, timeout=max(start_time + duration - time.perf_counter(), 0))
+        for connection in busy_sessions:
+            connection.cancel()
+        # Requests that did not get a session until the deadline are not issued at all.
+        for request in pending:
+            request.cancel()
+    await asyncio.gather(*requests, return_exceptions=cancel_at_deadline)
+    for connection in connections:
+        connection.close()
+    return samples
+
+
+def run(
+    connection_parameters, queries, session_count, rate, arrival_process, duration, seed=None, cancel_at_deadline=False
+):
+    """Issue the queries (dict of name -> SQL) at a fixed arrival rate from a pool of asynchronous sessions.
+
+    Returns one sample per request: (query name, scheduled offset in s, queueing delay in ms, service time in ms,
+    latency in ms). The latency is measured from the scheduled arrival, so it includes the time spent waiting for a
+    free session. With cancel_at_deadline, requests still running (or waiting) at the end of the duration are canceled
+    and dropped.
+    """
+    return asyncio.run(
+        drive(connection_parameters, queries, session_count, rate, arrival_process, duration, seed, cancel_at_deadline)
+    )
@@ -1,72 +1,313 @@
 import argparse as ap
-import re
+import csv
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Restores the row order of a table file from a reference file (e.g., the original CSV file of a transcoded table) or
+# sorts it by a key column. We rely on the same row order in all systems, so that pruning per chunk and dependency
+# discovery see the same physical layout. The file is sorted externally: workers sort runs of bounded size in
+# parallel, which are then merged. If there are many runs, they are merged in multiple passes so that only a bounded
+# number of run files is open at a time. The input is memory-mapped and never fully loaded.
+#
+# Records are separated by newlines. Depending on the format, a newline can also be part of a field:
+#   - plain: no escaping, every line is a record.
+#   - csv: fields may be quoted with '"', quotes within fields are doubled.
+#   - hana: special characters (including newlines and the separator) are escaped with '+' (see helpers/encode.py).
+formats = ["plain", "csv", "hana"]
+run_header = struct.Struct("<IQ")
+# Maximum number of runs that are merged at once.
+merge_fan_in = 64
 
 
 def parse_args():
     parser = ap.ArgumentParser()
     parser.add_argument("file", type=str)
     parser.add_argument("--sep", "-s", type=str, default="\u0007")
+    parser.add_argument("--format", "-f", type=str, default="hana", choices=formats)
+    parser.add_argument("--key_column", "-k", type=int, default=0, help="Position of the key (id) column")
+    parser.add_argument("--key_type", type=str, default="int", choices=["int", "string"])
+    parser.add_argument(
+        "--order_file", "-o", type=str, default=None, help="Restore the key order of this file, sort by key otherwise"
+    )
+    parser.add_argument("--order_sep", type=str, default=None, help="Defaults to --sep")
+    parser.add_argument("--order_format", type=str, default=None, choices=formats, help="Defaults to --format")
+    parser.add_argument("--order_key_column", type=int, default=None, help="Defaults to --key_column")
+    parser.add_argument("--output", type=str, default=None, help="Defaults to <file>.sorted.csv")
+    parser.add_argument("--memory", "-m", type=int, default=1024, help="Memory budget for the sorted runs in MiB")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count())
     return parser.parse_args()
 
 
-def main(file_name, sep):
-    tuples = []
-    original_table_file = (
-        "/Users/deyass/Documents/phd/dependency-based-optimization/resources/experiment_data/title.hana.csv"
-    )
+def record_boundaries(data, data_format, target_size):
+    # Splits the file into partitions of roughly target_size bytes that start and end at record boundaries.
+    boundaries = [0]
+    while boundaries[-1] < len(data):
+        start = boundaries[-1]
+        newline = data.find(b"\n", start + target_size - 1)
+        checked = start
+        quotes = 0
+        while newline != -1:
+            if data_format == "csv":
+                # Quotes come in pairs unless the newline is within a quoted field.
+                quotes += data[checked:newline].count(b'"')
+                checked = newline
+                if quotes % 2 == 0:
+                    break
+            elif data_format == "hana":
+                # The newline is escaped if an odd number of '+' precedes it.
+                escapes = 0
+                while newline - escapes > start and data[newline - escapes - 1] == ord("+"):
+                    escapes += 1
+                if escapes % 2 == 0:
+                    break
+            else:
+                break
+            newline = data.find(b"\n", newline + 1)
+        boundaries.append(len(data) if newline == -1 else newline + 1)
+    return boundaries
+
+
+def split_records(data, data_format):
+    records = []
+    record = None
+    for line in data.split(b"\n"):
+        record = line if record is None else record + b"\n" + line
+        if data_format == "csv" and record.count(b'"') % 2 == 1:
+            continue
+        if data_format == "hana" and (len(record) - len(record.rstrip(b"+"))) % 2 == 1:
+            continue
+        records.append(record)
+        record = None
+    if record is not None:
+        records.append(record)
+    # The last line of a partition is empty since partitions end with a newline.
+    if records and not records[-1]:
+        records.pop()
+    return records
+
+
+def key_field(record, sep, index, data_format):
+    if data_format == "plain" or (data_format == "csv" and b'"' not in record):
+        return record.split(sep, index + 1)[index]
+    if data_format == "hana" and b"+" not in record:
+        return record.split(sep, index + 1)[index]
+    if data_format == "csv":
+        return next(csv.reader([record.decode()], delimiter=sep.decode()))[index].encode()
+
+    # HANA: split at separators that are not escaped and remove the escape characters.
+    field_id = 0
+    field = bytearray()
+    position = 0
+    while position < len(record):
+        if record.startswith(b"+", position) and position + 1 < len(record):
+            if field_id == index:
+                field.append(record[position + 1])
+            position += 2
+        elif record.startswith(sep, position):
+            if field_id == index:
+                break
+            field_id += 1
+            position += len(sep)
+        else:
+            if field_id == index:
+                field.append(record[position])
+            position += 1
+    return bytes(field)
+
+
+def encode_key(value, key_type):
+    # Keys are compared as bytes. Integers are stored big-endian with a flipped sign bit, so the byte order is the same
+    # as the numeric order.
+    if key_type == "int":
+        return struct.pack(">Q", int(value) + (1 << 63))
+    return value
+
+
+def read_partition(file_path, begin, end, data_format):
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return split_records(data[begin:end], data_format)
+
+
+def partition_keys(file_path, begin, end, sep, data_format, key_column):
+    records = read_partition(file_path, begin, end, data_format)
+    return np.array([int(key_field(record, sep, key_column, data_format)) for record in records], dtype=np.int64)
+
+
+def sort_run(file_path, begin, end, sep, data_format, key_column, key_type, order_path, run_path):
+    records = read_partition(file_path, begin, end, data_format)
+    keys = [key_field(record, sep, key_column, data_format) for record in records]
+
+    if order_path is not None:
+        # Replace the keys by their position in the reference file.
+        sorted_keys = np.load(os.path.join(order_path, "keys.npy"), mmap_mode="r")
+        positions = np.load(os.path.join(order_path, "positions.npy"), mmap_mode="r")
+        keys = np.array([int(key) for key in keys], dtype=np.int64)
+        indexes = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        assert (sorted_keys[indexes] == keys).all(), f"{run_path}: keys missing in the reference file"
+        keys = [encode_key(position, "int") for position in positions[indexes]]
+    else:
+        keys = [encode_key(key, key_type) for key in keys]
 
-    print("Load order")
-    original_order = dict()
-
-    tid = 0
-    non_esc_quote_ct = 0
-    non_esc_esc_ct = 0
-    non_esc_quote = re.compile(r'(?<!\+)"')
-    non_esc_esc = re.compile(r'(?<!\+)\+(?!["+])')
-    max_title = ""
-
-    with open(original_table_file) as f:
-        for line in f:
-            non_esc_quote_ct += len(non_esc_quote.findall(line))
-            non_esc_esc_ct += len(non_esc_esc.findall(line))
-            t = line.strip().split(sep)
-            if len(t) > 0:
-                # original_order.append(int(t[0]))
-                original_order[int(t[0])] = tid
-                tid += 1
-                if len(t[1]) > len(max_title):
-                    max_title = t[1]
-    print(non_esc_quote_ct, non_esc_esc_ct)
-    print(len(original_order))
-    print(original_order[6010], original_order[98533], original_order[98721])
-    print(len(max_title), f"'{max_title}'")
-
-    print("Load data")
-    with open(file_name) as f:
-        for line in f:
-            t = line.strip().split(sep)
-            if len(t) > 0:
-                tuples.append(t)
-
-    print("Sort")
-    # tuples.sort(key=lambda t: original_order.index(int(t[0])))
-    tuples.sort(key=lambda t: original_order[int(t[0])])
-    print(min(int(t[0]) for t in tuples), max(int(t[0]) for t in tuples))
-
-    new_file_name = file_name
-    if file_name.endswith(".csv"):
-        new_file_name = new_file_name[: -len(".csv")]
-    new_file_name += ".sorted"
-    if file_name.endswith(".csv"):
-        new_file_name += ".csv"
-
-    print("Write data")
-    with open(new_file_name, "w") as f:
-        for t in tuples:
-            f.write(sep.join(t))
-            f.write("\n")
+    order = sorted(range(len(records)), key=keys.__getitem__)
+    with open(run_path, "wb") as f:
+        for record_id in order:
+            f.write(run_header.pack(len(keys[record_id]), len(records[record_id])))
+            f.write(keys[record_id])
+            f.write(records[record_id])
+    return len(records)
+
+
+def read_run(run_path, buffer_size):
+    with open(run_path, "rb", buffering=buffer_size) as f:
+        while header := f.read(run_header.size):
+            key_length, record_length = run_header.unpack(header)
+            yield f.read(key_length), f.read(record_length)
+
+
+def merged_runs(run_paths, buffer_size):
+    # heapq.merge is stable, so records with equal keys keep their order (given the runs are in input order).
+    return heapq.merge(*[read_run(run_path, buffer_size) for run_path in run_paths], key=lambda item: item[0])
+
+
+def merge_runs(run_paths, run_path, buffer_size):
+    # Merges the runs into a new run and removes them.
+    with open(run_path, "wb", buffering=buffer_size) as f:
+        for key, record in merged_runs(run_paths, buffer_size):
+            f.write(run_header.pack(len(key), len(record)))
+            f.write(key)
+            f.write(record)
+    for merged_run_path in run_paths:
+        os.remove(merged_run_path)
+    return run_path
+
+
+def partitions(file_path, data_format, target_size):
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            boundaries = record_boundaries(data, data_format, target_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def write_order(pool, order_file, sep, data_format, key_column, target_size, order_path):
+    # Stores the reference file's keys in sorted order along with their positions, so that workers can look up the
+    # position of a key with a binary search on the memory-mapped arrays.
+    ranges = partitions(order_file, data_format, target_size)
+    results = [
+        pool.submit(partition_keys, order_file, begin, end, sep, data_format, key_column) for begin, end in ranges
+    ]
+    keys = np.concatenate([result.result() for result in results]) if ranges else np.array([], dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    np.save(os.path.join(order_path, "keys.npy"), keys[order])
+    np.save(os.path.join(order_path, "positions.npy"), order)
+    return len(keys)
+
+
+def main(
+    file_name,
+    sep,
+    data_format,
+    key_column,
+    key_type,
+    order_file,
+    order_sep,
+    order_format,
+    order_key_column,
+    output,
+    memory,
+    workers,
+):
+    new_file_name = output
+    if new_file_name is None:
+        new_file_name = file_name
+        if file_name.endswith(".csv"):
+            new_file_name = new_file_name[: -len(".csv")]
+        new_file_name += ".sorted"
+        if file_name.endswith(".csv"):
+            new_file_name += ".csv"
+
+    # Every worker holds one run in memory at a time.
+    run_size = max(memory * 1024**2 // max(workers, 1), 1)
+    encoded_sep = sep.encode()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, tempfile.TemporaryDirectory(
+        dir=os.path.dirname(os.path.abspath(new_file_name))
+    ) as temporary_path:
+        order_path = None
+        if order_file is not None:
+            assert key_type == "int", "Restoring the order needs integer keys"
+            print("Load order")
+            order_path = temporary_path
+            key_count = write_order(
+                pool,
+                order_file,
+                (order_sep or sep).encode(),
+                order_format or data_format,
+                key_column if order_key_column is None else order_key_column,
+                run_size,
+                order_path,
+            )
+            print(f"- {key_count} keys")
+
+        print("Sort runs")
+        ranges = partitions(file_name, data_format, run_size)
+        run_paths = [os.path.join(temporary_path, f"run_{run_id}.bin") for run_id in range(len(ranges))]
+        runs = [
+            pool.submit(
+                sort_run, file_name, begin, end, encoded_sep, data_format, key_column, key_type, order_path, run_path
+            )
+            for (begin, end), run_path in zip(ranges, run_paths)
+        ]
+        print(f"- {sum(run.result() for run in runs)} records in {len(run_paths)} runs")
+
+        print("Merge runs")
+        # Every merge reads its runs with an equal share of the worker's memory budget.
+        buffer_size = max(run_size // merge_fan_in, 1 << 16)
+        merge_pass = 0
+        while len(run_paths) > merge_fan_in:
+            # Merge consecutive groups of runs in parallel. Keeping the groups in order keeps the merge stable.
+            merge_pass += 1
+            groups = []
+            for begin in range(0, len(run_paths), merge_fan_in):
+                end = begin + merge_fan_in
+                groups.append(run_paths[begin:end])
+            merges = [
+                pool.submit(
+                    merge_runs, group, os.path.join(temporary_path, f"run_{merge_pass}_{group_id}.bin"), buffer_size
+                )
+                for group_id, group in enumerate(groups)
+            ]
+            run_paths = [merge.result() for merge in merges]
+            print(f"- Pass {merge_pass}: merged into {len(run_paths)} runs")
+
+        with open(new_file_name + ".tmp", "wb") as f:
+            for _, record in merged_runs(run_paths, buffer_size):
+                f.write(record)
+                f.write(b"\n")
+        os.replace(new_file_name + ".tmp", new_file_name)
+    print(f"Written to {new_file_name}")
 
 
 if __name__ == "__main__":
     args = parse_args()
-    main(args.file, args.sep)
+    main(
+        args.file,
+        args.sep,
+        args.format,
+        args.key_column,
+        args.key_type,
+        args.order_file,
+        args.order_sep,
+        args.order_format,
+        args.order_key_column,
+        args.output,
+        args.memory,
+        args.workers,
+    )
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+import re
+
+# String literals, (quoted) identifiers, and the punctuation that structures FROM clauses.
+token_regex = re.compile(r"""'(?:[^']|'')*'|"\w+"|\w+|[(),;]""")
+# Keywords that end the table list of a FROM clause.
+clause_keywords = {
+    "WHERE",
+    "GROUP",
+    "ORDER",
+    "HAVING",
+    "LIMIT",
+    "UNION",
+    "INTERSECT",
+    "EXCEPT",
+    "ON",
+    "USING",
+    "WINDOW",
+    "SELECT",
+}
+
+
+def referenced_tables(query, table_names):
+    """Return the tables of table_names that the query reads, i.e., that appear in a FROM clause or a JOIN.
+
+    Identifiers elsewhere (e.g., the type in CAST(x AS date)) are ignored. Common table expressions and subqueries are
+    no problem: the names of CTEs are not in table_names and subqueries have FROM clauses of their own.
+    """
+    tables = set()
+    depth = 0
+    # Nesting levels with an open FROM clause. After FROM, JOIN, or a comma in a FROM clause, we expect a table.
+    from_depths = set()
+    expect_table = False
+    for token in token_regex.findall(query):
+        keyword = token.upper()
+        if token.startswith("'"):
+            expect_table = False
+        elif token == "(":
+            depth += 1
+            expect_table = False
+        elif token == ")":
+            from_depths.discard(depth)
+            depth -= 1
+        elif token == ",":
+            expect_table = depth in from_depths
+        elif keyword in ["FROM", "JOIN"]:
+            from_depths.add(depth)
+            expect_table = True
+        elif keyword in clause_keywords or token == ";":
+            from_depths.discard(depth)
+            expect_table = False
+        elif expect_table:
+            table_name = token.strip('"').lower()
+            if table_name in table_names:
+                tables.add(table_name)
+            expect_table = False
+    return tables
+
+
+def required_tables(queries, table_names, foreign_keys):
+    """Return the tables the queries read plus all tables they (transitively) reference via foreign keys."""
+    tables = set()
+    for query in queries:
+        tables |= referenced_tables(query, table_names)
+
+    references = {}
+    for table_name, _, referenced_table, _ in foreign_keys:
+        references.setdefault(table_name, set()).add(referenced_table)
+    pending_tables = list(tables)
+    while pending_tables:
+        for referenced_table in references.get(pending_tables.pop(), set()):
+            if referenced_table not in tables and referenced_table in table_names:
+                tables.add(referenced_table)
+                pending_tables.append(referenced_table)
+    return tables
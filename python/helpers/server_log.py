@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+import re
+import threading
+from datetime import datetime
+
+# Lines of the server output that we parse into events. The value is the named group "value" or the whole line.
+event_patterns = [
+    ("startup", re.compile(r"Server started at|MonetDB/SQL module loaded")),
+    ("dependency_discovery", re.compile(r"Executed dependency discovery in\s*(?P<value>.*)")),
+    ("plugin", re.compile(r"(?P<value>.*\b[Pp]lugin\b.*)")),
+    ("error", re.compile(r"(?P<value>.*\b(?:ERROR|Error|FATAL)\b.*)")),
+]
+
+
+class ServerLog:
+    """Reads the output streams of a server process in background threads and writes every line to a log file.
+
+    Servers block as soon as the pipe to their output is full, so the streams have to be drained for the whole run.
+    Each line is prefixed with a timestamp and the stream's name. Lines that match event_patterns are kept as events,
+    i.e., (timestamp, stream name, event, value) tuples.
+    """
+
+    def __init__(self, file_path, echo=False):
+        self.file = open(file_path, "w")
+        # While echo is set, lines are also printed, e.g., to show the server's startup output.
+        self.echo = echo
+        self.events = []
+        self.condition = threading.Condition()
+        self.threads = []
+        self.open_streams = 0
+
+    def drain(self, stream, stream_name):
+        with self.condition:
+            self.open_streams += 1
+        thread = threading.Thread(target=self._read, args=(stream, stream_name), daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _read(self, stream, stream_name):
+        for raw_line in iter(stream.readline, b""):
+            timestamp = datetime.now().isoformat(timespec="milliseconds")
+            line = raw_line.decode(errors="replace").rstrip("\n")
+            with self.condition:
+                if not self.file.closed:
+                    self.file.write(f"{timestamp} [{stream_name}] {line}\n")
+                    self.file.flush()
+                if self.echo:
+                    print(line)
+                for event, pattern in event_patterns:
+                    match = pattern.search(line)
+                    if match:
+                        value = match.groupdict().get("value") or line
+                        self.events.append((timestamp, stream_name, event, value.strip()))
+                        break
+                self.condition.notify_all()
+        stream.close()
+        with self.condition:
+            self.open_streams -= 1
+            self.condition.notify_all()
+
+    def wait_for(self, event, timeout=None):
+        """Wait until the event (see event_patterns) occurred.
+
+        Returns the first such event or None if the timeout passed or the server closed its streams before.
+        """
+
+        def find_event():
+            return next((entry for entry in self.events if entry[2] == event), None)
+
+        with self.condition:
+            self.condition.wait_for(lambda: find_event() is not None or self.open_streams == 0, timeout)
+            return find_event()
+
+    def close(self, timeout=10):
+        # The threads end once the server closed its streams, i.e., after it exited.
+        for thread in self.threads:
+            thread.join(timeout)
+        with self.condition:
+            self.file.close()
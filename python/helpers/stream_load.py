@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+import gzip
+import os
+import queue
+import threading
+
+# Source files may be compressed with zstd or gzip. Compressed files are preferred if several variants exist, since
+# they have to be read from disk anyway and are several times smaller than the plain CSV files.
+compression_suffixes = [".zst", ".gz", ""]
+buffer_size = 1 << 23
+
+
+def source_file_path(file_path):
+    """Return the path of the (possibly compressed) variant of the file, or None if there is none."""
+    for suffix in compression_suffixes:
+        if os.path.isfile(file_path + suffix):
+            return file_path + suffix
+    return None
+
+
+def open_decompressed(file_path):
+    if file_path.endswith(".zst"):
+        # zstandard is only required for zstd-compressed data.
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rb")
+    return open(file_path, "rb")
+
+
+class PrefetchingReader:
+    """File-like object that reads (and decompresses) a file in a background thread.
+
+    The thread keeps up to queue_depth blocks of block_size bytes ready, so decompression overlaps with sending the data
+    to the DBMS. read() returns at most one block at a time, which is fine for COPY, which reads until it gets b"".
+    """
+
+    def __init__(self, file_path, block_size=buffer_size, queue_depth=4):
+        self.file_path = file_path
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=queue_depth)
+        self.block = memoryview(b"")
+        self.finished = False
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.decompress, daemon=True)
+        self.thread.start()
+
+    def decompress(self):
+        try:
+            with open_decompressed(self.file_path) as f:
+                while not self.stopped.is_set():
+                    block = f.read(self.block_size)
+                    if not block:
+                        break
+                    self.blocks.put(block)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.blocks.put(None)
+
+    def read(self, size=-1):
+        if not self.block:
+            if self.finished:
+                return b""
+            block = self.blocks.get()
+            if block is None:
+                self.finished = True
+                if self.error is not None:
+                    raise self.error
+                return b""
+            self.block = memoryview(block)
+
+        size = len(self.block) if size is None or size < 0 else size
+        data = self.block[:size]
+        self.block = self.block[size:]
+        return data.tobytes()
+
+    def close(self):
+        # Unblock the background thread if the consumer stopped early.
+        self.stopped.set()
+        while not self.finished:
+            self.finished = self.blocks.get() is None
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def copy_from_stdin(cursor, copy_statement, file_path):
+    """Stream the (decompressed) file into a COPY ... FROM STDIN statement via psycopg2."""
+    with PrefetchingReader(file_path) as reader:
+        cursor.copy_expert(copy_statement, reader, size=buffer_size)
+
+
+def monetdb_uploader(data_path):
+    """Return an uploader that serves MonetDB's COPY ... ON CLIENT requests from the files in data_path.
+
+    File names in the COPY statement are relative to data_path and may refer to compressed variants of the files.
+    """
+    import pymonetdb
+
+    class StreamingUploader(pymonetdb.Uploader):
+        def handle_upload(self, upload, file_name, text_mode, skip_amount):
+            assert skip_amount == 0, "Skipping rows is not supported"
+            file_path = source_file_path(os.path.join(data_path, file_name))
+            if file_path is None:
+                upload.send_error(f"File not found: {file_name}")
+                return
+
+            writer = upload.binary_writer()
+            with PrefetchingReader(file_path) as reader:
+                while block := reader.read():
+                    if upload.is_cancelled():
+                        break
+                    writer.write(block)
+
+    return StreamingUploader()
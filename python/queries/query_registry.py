@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+import importlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+# Loads the queries of a benchmark when they are requested for the first time: the static query modules are imported
+# and the SQL files of JOB and TPC-DS are read only for the selected benchmarks. The final query set of a benchmark,
+# i.e., with the variants of the DBMS and the enabled rewrites applied, is cached on disk. The cache is used as long as
+# the files it was built from have the same modification times.
+benchmarks = ["TPCH", "TPCDS", "SSB", "JOB"]
+query_counts = {"TPCH": 22, "TPCDS": 48, "SSB": 13, "JOB": 113}
+static_modules = {
+    "TPCH": "static_tpch_queries",
+    "TPCDS": "static_tpcds_queries",
+    "SSB": "static_ssb_queries",
+    "JOB": "static_job_queries",
+}
+# Directory and blacklisted files of the benchmarks whose queries are SQL files in the Hyrise repository.
+job_path = "hyrise/third_party/join-order-benchmark"
+tpcds_path = "hyrise/resources/benchmark/tpcds"
+tpcds_query_path = os.path.join(tpcds_path, "tpcds-result-reproduction/query_qualification")
+tpcds_blacklist_file = os.path.join(tpcds_path, "query_blacklist.cfg")
+# Prefix of the dialect-specific query variants per benchmark and DBMS (e.g., hana_queries and hana_queries_o3). For a
+# fair comparison, we use the same SSB queries as the Umbra demo does.
+dialects = {
+    "TPCH": {"hana": "hana", "hana-int": "hana"},
+    "JOB": {"hana": "hana", "hana-int": "hana"},
+    "SSB": {"hana": "umbra", "hana-int": "umbra", "umbra": "umbra"},
+    "TPCDS": {},
+}
+hana_hints = ["HEX_TABLE_SCAN_SEMI_JOIN"]
+
+
+def query_blacklist(filename):
+    blacklist = set()
+    with open(filename) as f:
+        for line in f:
+            if not line.startswith("#"):
+                blacklist.add(line.strip())
+    return blacklist
+
+
+def sql_files(benchmark):
+    if benchmark == "JOB":
+        return [
+            path for path in sorted(Path(job_path).glob("*.sql")) if path.name not in ["fkindexes.sql", "schema.sql"]
+        ]
+    if benchmark == "TPCDS":
+        blacklist = query_blacklist(tpcds_blacklist_file)
+        return [path for path in sorted(Path(tpcds_query_path).glob("*.sql")) if path.name not in blacklist]
+    return []
+
+
+def load_queries(paths):
+    queries = {}
+    for path in paths:
+        if not path.is_file():
+            continue
+
+        with open(path, "r") as sql_file:
+            queries[path.stem] = sql_file.read().strip()
+    return queries
+
+
+def source_files(benchmark):
+    # All files the query set depends on. This file is included since it defines how the variants are applied.
+    files = [__file__, os.path.join(os.path.dirname(__file__), f"{static_modules[benchmark]}.py")]
+    if benchmark == "TPCDS":
+        files.append(tpcds_blacklist_file)
+    return files + [str(path) for path in sql_files(benchmark)]
+
+
+def add_hana_hints(original_queries, items):
+    updated_queries = original_queries.copy()
+    for item in items:
+        query = original_queries[item].strip()
+        if query.endswith(";"):
+            query = query[:-1]
+        query += f""" WITH HINT({", ".join(hana_hints)});"""
+        updated_queries[item] = query
+    return updated_queries
+
+
+def adjust_dialect(query, dbms):
+    if dbms == "monetdb":
+        return (
+            query.replace("!=", "<>")
+            .replace("SELECT MIN(chn.name) AS character,", 'SELECT MIN(chn.name) AS "character",')
+            .replace("ss_list_price BETWEEN 122 AND 122+10", "ss_list_price BETWEEN 122 AND 122+10.0")
+        )
+    return query
+
+
+def build_queries(benchmark, dbms, o1, o3):
+    module = importlib.import_module(f"queries.{static_modules[benchmark]}")
+    queries = dict(module.queries) if benchmark in ["TPCH", "SSB"] else load_queries(sql_files(benchmark))
+
+    # Apply the variants in the order original, dialect, O1, and O3. Not every module defines every variant.
+    prefix = dialects[benchmark].get(dbms)
+    variants = [f"{prefix}_queries"] if prefix else []
+    for enabled, suffix in [(o1, "_o1"), (o3, "_o3")]:
+        if enabled:
+            variants += [f"queries{suffix}"] + ([f"{prefix}_queries{suffix}"] if prefix else [])
+    for variant in variants:
+        queries.update(getattr(module, variant, {}))
+
+    if dbms == "hana-int":
+        queries = add_hana_hints(queries, list(module.queries_o3.keys()))
+
+    assert (
+        len(queries) == query_counts[benchmark]
+    ), f"Expected {query_counts[benchmark]} {benchmark} queries, found {len(queries)}"
+    query_names = [f"{benchmark} {q}" for q in sorted(queries.keys())]
+    return query_names, [adjust_dialect(queries[q], dbms) for q in sorted(queries.keys())]
+
+
+@lru_cache(maxsize=None)
+def benchmark_queries(benchmark, dbms, o1=False, o3=False, cache_path="db_comparison_data/query_cache"):
+    """Return the names and the queries of a benchmark for the DBMS, optionally with the O1 and O3 rewrites.
+
+    Queries are ordered by their names, which are prefixed with the benchmark (e.g., "TPCH 1").
+    """
+    sources = {file_name: os.stat(file_name).st_mtime_ns for file_name in source_files(benchmark)}
+    cache_file = os.path.join(cache_path, f"{benchmark}_{dbms}{'_o1' if o1 else ''}{'_o3' if o3 else ''}.json")
+    if os.path.isfile(cache_file):
+        with open(cache_file) as f:
+            cached = json.load(f)
+        if cached["sources"] == sources:
+            return cached["query_names"], cached["queries"]
+
+    query_names, queries = build_queries(benchmark, dbms, o1, o3)
+    os.makedirs(cache_path, exist_ok=True)
+    # Runners on other NUMA nodes might write the same cache file concurrently.
+    temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temporary_file, "w") as f:
+        json.dump({"sources": sources, "query_names": query_names, "queries": queries}, f)
+    os.replace(temporary_file, cache_file)
+    return query_names, queries
@@ -0,0 +1,367 @@
+#!/usr/bin/python3
+
+import argparse as ap
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+
+# Runs a matrix of systems x configurations x client counts with db_comparison_runner.py. The matrix is a JSON file:
+#   {"systems": {"hyrise": ["baseline", "rewrites", "keys", "rewrites_keys", "int"], "monetdb": [...]},
+#    "clients": [32], "runner_args": ["--time", "7200"]}
+# All client counts of a configuration run in one runner invocation (--clients_sweep), i.e., they share the loaded data
+# and the server process. Systems that persist their data load it once per database and reuse it for the remaining
+# configurations. Finished runs are recorded in a state file, so a crashed campaign continues where it stopped.
+#
+# With multiple NUMA nodes, independent databases run concurrently, one per node. Each gets the node's CPUs and memory
+# (numactl -C/-m), its own port, and its own data directory.
+configs = {
+    "baseline": [],
+    "rewrites": ["--rewrites"],
+    "keys": ["--schema_keys"],
+    "rewrites_keys": ["--rewrites", "--schema_keys"],
+    "int": [],
+}
+# Configurations that add schema constraints. We run them after the other configurations of a system.
+key_configs = ["keys", "rewrites_keys"]
+# Systems with an internal optimizer have an -int variant in the runner.
+int_systems = ["hyrise", "hana"]
+# Systems that keep their data between runner invocations. The runner always loads Hyrise's data.
+persistent_systems = ["monetdb", "umbra", "greenplum", "hana"]
+# Umbra cannot drop constraints. Thus, its runs with constraints need a fresh database.
+fresh_database_for_keys = ["umbra"]
+# Systems whose servers we start per NUMA node (DuckDB runs inside the runner). Greenplum and HANA are set up
+# separately (HANA even runs on another machine), so only one of their databases runs at a time.
+partitionable_systems = ["hyrise", "monetdb", "umbra", "duckdb"]
+default_ports = {"monetdb": 50000, "hyrise": 5432, "umbra": 5432}
+data_dirs = {"monetdb": "db_comparison_data/monetdb/data", "umbra": "db_comparison_data/umbra"}
+# Shell commands to create a fresh database before the first run and to remove it after the last run of a database.
+# Placeholders: {cwd} is the working directory, {data_dir} and {port} are the database's data directory and port,
+# {suffix} distinguishes the databases of different NUMA nodes, and {docker_cpuset} binds Docker to the NUMA node.
+lifecycles = {
+    "monetdb": {
+        "setup": ["rm -rf {data_dir}", "mkdir -p {data_dir}"],
+        "teardown": ["rm -rf {data_dir}"],
+    },
+    "umbra": {
+        "setup": [
+            "rm -rf {data_dir}",
+            "mkdir -p {data_dir}",
+            "sudo systemctl start docker docker.socket",
+            "sudo docker run -v {cwd}/{data_dir}:/var/db -v {cwd}:{cwd} -p {port}:5432 {docker_cpuset} "
+            "--name umbra-bench{suffix} -d umbradb/umbra:25.01",
+        ],
+        # We only remove the container. Unlike docker system prune -fa, this keeps the image for the next database.
+        "teardown": ["sudo docker stop umbra-bench{suffix}", "sudo docker rm umbra-bench{suffix}", "rm -rf {data_dir}"],
+    },
+}
+# Relative bandwidth loss that we accept when all NUMA nodes are busy.
+max_interference = 0.1
+
+
+def parse_args():
+    parser = ap.ArgumentParser()
+    parser.add_argument("matrix", type=str, help="JSON file with the experiment matrix")
+    parser.add_argument(
+        "--nodes", "--node", "-n", type=str, default="0", help="NUMA nodes to run on, e.g., 0,1, all, or -1 for none"
+    )
+    parser.add_argument("--cores", type=int, default=None, help="Cores per node, defaults to all cores of the node")
+    parser.add_argument("--clients", type=str, default=None, help="Client counts, e.g., 1,32. Overrides the matrix")
+    parser.add_argument("--state", type=str, default="db_comparison_results/experiments_state.json")
+    parser.add_argument("--log_dir", type=str, default="db_comparison_results/experiment_logs")
+    parser.add_argument("--skip_interference_check", action="store_true")
+    parser.add_argument("--dry_run", action="store_true", help="Only print the planned commands")
+    return parser.parse_args()
+
+
+def run_name(dbms, config, client_counts):
+    return f"{dbms}__{config}__clients_{'_'.join(str(client_count) for client_count in client_counts)}"
+
+
+def plan(matrix):
+    """Order the matrix's runs into databases, i.e., lists of runs that share one freshly set up database.
+
+    Returns a list of (system, runs), where a run is a dict with name, dbms, config, and clients. Within a database,
+    only the first run that is executed loads the data (if the system persists it). Runs of systems that do not persist
+    their data share nothing, so each of them is a database of its own.
+    """
+    client_counts = sorted(matrix.get("clients", [1]))
+    databases = []
+    for system, system_configs in matrix["systems"].items():
+        for config in system_configs:
+            assert config in configs, f"Unknown configuration '{config}' for {system}"
+            assert config != "int" or system in int_systems, f"{system} has no internal optimizer"
+
+        ordered_configs = [config for config in configs if config in system_configs]
+        config_groups = [ordered_configs]
+        if system not in persistent_systems:
+            config_groups = [[config] for config in ordered_configs]
+        elif system in fresh_database_for_keys:
+            config_groups = [
+                [config for config in ordered_configs if config not in key_configs],
+                [config for config in ordered_configs if config in key_configs],
+            ]
+
+        for config_group in config_groups:
+            runs = []
+            for config in config_group:
+                dbms = f"{system}-int" if config == "int" else system
+                runs.append(
+                    {
+                        "name": run_name(dbms, config, client_counts),
+                        "dbms": dbms,
+                        "config": config,
+                        "clients": client_counts,
+                    }
+                )
+            if runs:
+                databases.append((system, runs))
+    return databases
+
+
+def parse_cpu_list(cpu_string):
+    cpus = list()
+    for cpu_range in cpu_string.split(","):
+        if "-" in cpu_range:
+            first, last = cpu_range.split("-")
+            cpus += list(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(cpu_range))
+    return cpus
+
+
+def node_cpus(node):
+    with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+        return f.read().strip()
+
+
+def numa_nodes():
+    # Nodes without CPUs (e.g., memory-only nodes) cannot run experiments.
+    nodes = sorted(
+        int(name.replace("node", "", 1))
+        for name in os.listdir("/sys/devices/system/node")
+        if name.startswith("node") and name.replace("node", "", 1).isdigit()
+    )
+    return [node for node in nodes if node_cpus(node)]
+
+
+class Slot:
+    """A NUMA node that runs one database at a time. The slots' indexes separate their ports and data directories."""
+
+    def __init__(self, node, index, cores, partitioned):
+        self.node = node
+        self.index = index
+        self.cpus = node_cpus(node) if node >= 0 else None
+        self.cores = cores or (len(parse_cpu_list(self.cpus)) if self.cpus else os.cpu_count())
+        self.partitioned = partitioned
+
+    def numactl_command(self):
+        return ["numactl", "-C", self.cpus, "-m", str(self.node)] if self.node >= 0 else []
+
+    def suffix(self):
+        return f"_node{self.node}" if self.partitioned else ""
+
+    def port(self, system):
+        return default_ports[system] + self.index if system in default_ports else None
+
+    def data_dir(self, system):
+        return data_dirs[system] + self.suffix() if system in data_dirs else None
+
+
+def runner_command(run, system, slot, load_data, runner_args):
+    command = slot.numactl_command() + ["./python/db_comparison_runner.py", run["dbms"], "--cores", str(slot.cores)]
+    command += ["-m", str(slot.node)] if slot.node >= 0 else ["--no_numactl"]
+    if slot.partitioned and system in default_ports:
+        command += ["--port", str(slot.port(system))]
+        if system == "monetdb":
+            command += ["--dbpath", slot.data_dir(system)]
+    if len(run["clients"]) > 1:
+        command += ["--clients_sweep", ",".join(str(client_count) for client_count in run["clients"])]
+    else:
+        command += ["--clients", str(run["clients"][0])]
+    command += configs[run["config"]]
+    if not load_data:
+        command.append("--skip_data_loading")
+    return command + runner_args
+
+
+def lifecycle_commands(system, step, slot):
+    docker_cpuset = f"--cpuset-cpus {slot.cpus} --cpuset-mems {slot.node}" if slot.node >= 0 else ""
+    return [
+        command.format(
+            cwd=os.getcwd(),
+            data_dir=slot.data_dir(system),
+            port=slot.port(system),
+            suffix=slot.suffix(),
+            docker_cpuset=docker_cpuset,
+        )
+        for command in lifecycles.get(system, {}).get(step, [])
+    ]
+
+
+class State:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.finished = []
+        if os.path.isfile(file_path):
+            with open(file_path) as f:
+                self.finished = json.load(f)["finished"]
+
+    def add(self, name):
+        with self.lock:
+            self.finished.append(name)
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            # Replace the state atomically so that it is never broken, even if we are killed while writing it.
+            with open(self.file_path + ".tmp", "w") as f:
+                json.dump({"finished": self.finished}, f)
+            os.replace(self.file_path + ".tmp", self.file_path)
+
+
+def execute(command, dry_run, shell=False, log_file=None):
+    print(f"$ {command if shell else shlex.join(command)}", flush=True)
+    if dry_run:
+        return 0
+    if log_file is None:
+        return subprocess.run(command, shell=shell).returncode
+    # Concurrent runners would garble each other's progress output, so each writes to its own log.
+    with open(log_file, "a") as log:
+        return subprocess.run(command, shell=shell, stdout=log, stderr=subprocess.STDOUT).returncode
+
+
+def run_database(system, runs, state, slot, runner_args, log_dir, dry_run):
+    # Returns whether all runs of the database succeeded. After a failure, the database is in an unknown state, so we
+    # skip its remaining runs. They are repeated with a fresh database when the campaign is resumed.
+    pending_runs = [run for run in runs if run["name"] not in state.finished]
+    if not pending_runs:
+        print(f"- Skipping {len(runs)} finished runs of {system}.")
+        return True
+
+    for command in lifecycle_commands(system, "setup", slot):
+        if execute(command, dry_run, shell=True) != 0:
+            print(f"- Setting up {system} failed.")
+            return False
+
+    success = True
+    for position, run in enumerate(pending_runs):
+        # A resumed database is set up from scratch, so the first pending run loads the data.
+        load_data = position == 0 or system not in persistent_systems
+        node_description = f" on node {slot.node}" if slot.partitioned else ""
+        print(f"- Run {run['name']}{node_description} ({'load data' if load_data else 'reuse data'})", flush=True)
+        log_file = os.path.join(log_dir, f"{run['name']}.log") if slot.partitioned else None
+        if execute(runner_command(run, system, slot, load_data, runner_args), dry_run, log_file=log_file) != 0:
+            print(f"- Run {run['name']} failed.")
+            success = False
+            break
+        if not dry_run:
+            state.add(run["name"])
+
+    for command in lifecycle_commands(system, "teardown", slot):
+        execute(command, dry_run, shell=True)
+    return success
+
+
+def run_probe(slots, workers):
+    # Starts the bandwidth probe on all slots at the same time and returns each slot's bandwidth.
+    command = [sys.executable, os.path.join(os.path.dirname(__file__), "helpers", "interference_probe.py")]
+    probes = [
+        subprocess.Popen(slot.numactl_command() + command + ["--workers", str(workers)], stdout=subprocess.PIPE)
+        for slot in slots
+    ]
+    return [json.loads(probe.communicate()[0])["bandwidth"] for probe in probes]
+
+
+def check_interference(slots):
+    # Compares each node's memory bandwidth alone to its bandwidth while all nodes are busy. Returns whether the nodes
+    # are independent enough to run experiments concurrently.
+    workers = min(slot.cores for slot in slots)
+    alone = [run_probe([slot], workers)[0] for slot in slots]
+    together = run_probe(slots, workers)
+    independent = True
+    for slot, alone_bandwidth, together_bandwidth in zip(slots, alone, together):
+        interference = 1 - together_bandwidth / alone_bandwidth
+        print(
+            f"- Node {slot.node}: {round(alone_bandwidth / 1000**3, 1)} GB/s alone, "
+            f"{round(together_bandwidth / 1000**3, 1)} GB/s co-running ({interference:.1%} interference)"
+        )
+        independent = independent and interference <= max_interference
+    return independent
+
+
+def main(matrix_file, nodes, cores, client_counts, state_file, log_dir, skip_interference_check, dry_run):
+    with open(matrix_file) as f:
+        matrix = json.load(f)
+    if client_counts:
+        matrix["clients"] = client_counts
+
+    databases = plan(matrix)
+    state = State(state_file)
+    run_count = sum(len(runs) for _, runs in databases)
+    print(f"Planned {run_count} runs on {len(databases)} databases, {len(state.finished)} runs finished before.")
+
+    assert len(nodes) == 1 or -1 not in nodes, "Running concurrently requires NUMA nodes to bind to"
+    slots = [Slot(node, index, cores, len(nodes) > 1) for index, node in enumerate(nodes)]
+    if len(slots) > 1:
+        os.makedirs(log_dir, exist_ok=True)
+        # Start with the databases that have the most runs, so no node is left with a long database at the end.
+        databases.sort(key=lambda database: len(database[1]), reverse=True)
+        if not skip_interference_check and not dry_run:
+            print(f"Checking the interference of NUMA nodes {', '.join(str(slot.node) for slot in slots)} ...")
+            if not check_interference(slots):
+                print(f"Nodes interfere by more than {max_interference:.0%}. Use fewer nodes or skip the check.")
+                sys.exit(1)
+
+    # Every slot takes the next database whose system is not busy. Only one database of the systems that we cannot
+    # partition runs at a time.
+    failed_systems = []
+    running_systems = []
+    condition = threading.Condition()
+
+    def next_database():
+        with condition:
+            while databases:
+                for position, (system, _) in enumerate(databases):
+                    if system in partitionable_systems or system not in running_systems:
+                        running_systems.append(system)
+                        return databases.pop(position)
+                condition.wait()
+            return None
+
+    def work(slot):
+        while (database := next_database()) is not None:
+            system, runs = database
+            try:
+                if not run_database(system, runs, state, slot, matrix.get("runner_args", []), log_dir, dry_run):
+                    failed_systems.append(system)
+            finally:
+                with condition:
+                    running_systems.remove(system)
+                    condition.notify_all()
+
+    workers = [threading.Thread(target=work, args=(slot,)) for slot in slots]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if failed_systems:
+        print(f"Runs of {', '.join(failed_systems)} failed. Run again to resume.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client_counts = [int(client_count) for client_count in args.clients.split(",")] if args.clients else None
+    nodes = numa_nodes() if args.nodes == "all" else [int(node) for node in args.nodes.split(",")]
+    main(
+        args.matrix,
+        nodes,
+        args.cores,
+        client_counts,
+        args.state,
+        args.log_dir,
+        args.skip_interference_check,
+        args.dry_run,
+    )